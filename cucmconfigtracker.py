@@ -33,20 +33,45 @@ To run this application using uv, use the command "uv run <script_name> <require
 # ///
 
 import argparse
+import atexit
+import base64
+import contextlib
 import csv
+import fcntl
+import fnmatch
+import functools
 import getpass
+import gzip
+import hashlib
+import io
 import json
 import logging
+import multiprocessing
 import os
 import re
+import shutil
+import signal
 import socket
+import sqlite3
 import subprocess
 import sys
+import tempfile
+import threading
 import time
+import urllib.parse
+from collections import Counter
+from concurrent.futures import (
+    FIRST_COMPLETED,
+    ProcessPoolExecutor,
+    ThreadPoolExecutor,
+    wait,
+)
 from csv import reader
-from datetime import datetime
+from dataclasses import asdict, dataclass, field
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from itertools import repeat
 from pathlib import Path
-from shutil import copyfile
 from typing import Any
 from xml.etree import ElementTree as ET
 
@@ -57,15 +82,19 @@ from InquirerPy import inquirer
 from lxml import etree
 from paramiko import SSHClient
 from paramiko_expect import SSHClientInteraction
-from requests import Session
+from requests import Response, Session
 from requests.auth import HTTPBasicAuth
+from requests.exceptions import RequestException
 from tabulate import tabulate
 from zeep.cache import SqliteCache
 from zeep.client import Client
-from zeep.exceptions import Fault
+from zeep.exceptions import Fault, TransportError
 from zeep.plugins import HistoryPlugin, Plugin
 from zeep.settings import Settings
 from zeep.transports import Transport
+from zeep.wsdl import Document
+
+from cucmstatus import STATUS_PORT, profile_control, status_check
 
 
 class RequestResponseLoggingPlugin(Plugin):
@@ -92,21 +121,1429 @@ class ServerCredentialError(Exception):
     pass
 
 
+class ReplayExhaustedError(Exception):
+    """Raised when a replayed run asks for more traffic than was recorded."""
+
+
+class TrafficArchive:
+    """Records the AXL and CLI traffic of a run to a gzip archive, or replays it.
+
+    Each response is a JSON line flushed as its own gzip member. A replay matches AXL
+    requests on their canonical envelope, only listChange polls fall back to the next
+    recorded poll.
+    """
+
+    def __init__(self, path, mode, speed="original"):
+        self.path = path
+        self.mode = mode
+        self.speed = speed
+        self.lock = threading.Lock()
+        self.entries = {}
+        self.last = {}
+        if mode == "record":
+            self.file = open(path, "wb")
+            self.record(
+                {
+                    "version": TRAFFIC_ARCHIVE_VERSION,
+                    "recorded": datetime.now().isoformat(),
+                }
+            )
+        else:
+            with gzip.open(path, "rt") as f:
+                header = json.loads(next(f))
+                if header.get("version") != TRAFFIC_ARCHIVE_VERSION:
+                    raise ValueError(
+                        f"{path} was recorded by another version of the script, record it again"
+                    )
+                for entry in self.read_entries(f):
+                    for key in self.entry_keys(entry):
+                        self.entries.setdefault(key, []).append(entry)
+            for queue in self.entries.values():
+                queue.reverse()
+
+    def entry_keys(self, entry) -> tuple:
+        if entry["kind"] == "ssh":
+            return (("ssh", entry["host"], entry["cmd"]),)
+        return axl_replay_keys(entry["key"], entry["action"])
+
+    def read_entries(self, f):
+        try:
+            for line in f:
+                yield json.loads(line)
+        except (EOFError, gzip.BadGzipFile, ValueError):
+            # The last line of a run killed while recording, the others are complete.
+            logging.warning(f"Ignoring the truncated end of {self.path}")
+
+    def record(self, entry) -> None:
+        line = gzip.compress((json.dumps(entry) + "\n").encode(), mtime=0)
+        with self.lock:
+            self.file.write(line)
+            self.file.flush()
+
+    def replay(self, keys, request) -> dict:
+        """Next unserved entry of the first key that has one"""
+        with self.lock:
+            entry = None
+            for key in keys:
+                queue = self.entries.get(key)
+                while queue:
+                    candidate = queue.pop()
+                    if not candidate.get("served"):
+                        entry = candidate
+                        break
+                if entry is not None:
+                    break
+            if entry is None:
+                # Requests repeated more often than recorded get the last answer again,
+                # only a listChange poll past the end of the recording ends the replay.
+                entry = self.last.get(keys[0])
+                if entry is None or entry.get("action", "").endswith("listChange"):
+                    raise ReplayExhaustedError(f"No recorded traffic for {request}")
+            entry["served"] = True
+            self.last[keys[0]] = entry
+        if self.speed == "original":
+            time.sleep(entry["elapsed"])
+        return entry
+
+    def axl(self, address, message, headers, post) -> Response:
+        key = envelope_key(message)
+        action = headers.get("SOAPAction", "").strip('"')
+        if self.mode == "replay":
+            entry = self.replay(axl_replay_keys(key, action), action)
+            response = Response()
+            response.status_code = entry["status"]
+            response.headers.update(entry["headers"])
+            response._content = base64.b64decode(entry["content"])
+            response.encoding = "utf-8"
+            response.url = address
+            return response
+        start = time.monotonic()
+        response = post(address, message, headers)
+        self.record(
+            {
+                "kind": "axl",
+                "address": address,
+                "action": action,
+                "key": key,
+                "status": response.status_code,
+                "headers": dict(response.headers),
+                "content": base64.b64encode(response.content).decode(),
+                "elapsed": round(time.monotonic() - start, 4),
+            }
+        )
+        return response
+
+    def ssh(self, host, cmd, run) -> str:
+        if self.mode == "replay":
+            return self.replay((("ssh", host, cmd),), f"{cmd} on {host}")["output"]
+        start = time.monotonic()
+        output = run()
+        self.record(
+            {
+                "kind": "ssh",
+                "host": host,
+                "cmd": cmd,
+                "output": output,
+                "elapsed": round(time.monotonic() - start, 4),
+            }
+        )
+        return output
+
+    def close(self) -> None:
+        if self.mode == "record":
+            self.file.close()
+
+
+def envelope_key(message) -> str:
+    """Hash of the canonical form of a SOAP envelope, of its bytes if it isn't XML"""
+    if isinstance(message, str):
+        message = message.encode()
+    try:
+        message = etree.tostring(
+            etree.fromstring(message, etree.XMLParser(remove_blank_text=True)),
+            method="c14n",
+        )
+    except etree.XMLSyntaxError:
+        pass
+    return hashlib.sha256(message).hexdigest()
+
+
+def axl_replay_keys(key, action) -> tuple:
+    # The listChange cursor may differ from the recorded run, the other requests
+    # must match exactly so a replay never serves the answer of another query.
+    if action.endswith("listChange"):
+        return (("axl", key), ("axl", action))
+    return (("axl", key),)
+
+
+class ArchiveTransport(Transport):
+    """zeep transport passing every AXL request through the traffic archive"""
+
+    def __init__(self, archive, **kwargs):
+        super().__init__(**kwargs)
+        self.archive = archive
+
+    def post(self, address, message, headers):
+        return self.archive.axl(address, message, headers, super().post)
+
+
+class BudgetExceededError(Exception):
+    """Raised when pulling a streaming config item takes longer than its time budget."""
+
+    pass
+
+
+class SnapshotWriter:
+    """Publishes changed snapshot files as one new generation, other files in place.
+
+    Snapshots are staged in a hard linked copy of the current generation, flush()
+    swaps the current symlink to it so readers never see a mix of two cycles.
+    """
+
+    def __init__(self):
+        self.dirty_dirs = set()
+        self.staging = {}
+        self.bases = {}
+        self.written = {}
+        self.published = {}
+        self.views = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.flush()
+        else:
+            self.discard()
+
+    def target_path(self, path) -> str:
+        """Where a write to path goes, the staged generation for snapshot files"""
+        location = snapshot_location(path)
+        if location is None:
+            return path
+        root, which_config, name = location
+        if root not in self.staging:
+            self.staging[root], self.bases[root] = stage_generation(root)
+            # The thread reads what it wrote, ex: to diff a refreshed running config.
+            views = SNAPSHOT_VIEWS.__dict__.setdefault("pinned", {})
+            self.views[root] = (views, views.get(root))
+            views[root] = self.staging[root]
+        self.written.setdefault(root, set()).add((which_config, name))
+        return os.path.join(self.staging[root], which_config, name)
+
+    def current_path(self, path) -> str:
+        """The file a write to path is compared with, staged by this writer or current"""
+        location = snapshot_location(path)
+        if location is None or location[0] not in self.staging:
+            return path
+        root, which_config, name = location
+        return os.path.join(self.staging[root], which_config, name)
+
+    def write(self, path, content) -> bool:
+        """Writes content to path unless it already holds the same bytes"""
+        new_hash = hashlib.sha256(content).hexdigest()
+        try:
+            with open(self.current_path(path), "rb") as f:
+                if hashlib.file_digest(f, "sha256").hexdigest() == new_hash:
+                    return False
+            mode = os.stat(self.current_path(path)).st_mode & 0o777
+        except FileNotFoundError:
+            mode = 0o644
+        path = self.target_path(path)
+        directory = os.path.dirname(path) or "."
+        fd, tmp_path = tempfile.mkstemp(
+            dir=directory, prefix=f".{os.path.basename(path)}.", suffix=".tmp"
+        )
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(content)
+                f.flush()
+                os.fsync(f.fileno())
+            os.chmod(tmp_path, mode)
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+        self.dirty_dirs.add(directory)
+        return True
+
+    def write_stream(self, path, chunks) -> bool:
+        """Streams chunks of bytes to path, publishing them only if the content changed.
+
+        Used for snapshots too large to hold in memory, so the content hash is computed
+        while writing the temporary file and compared with the current one at the end.
+        """
+        try:
+            with open(self.current_path(path), "rb") as f:
+                current_hash = hashlib.file_digest(f, "sha256").hexdigest()
+            mode = os.stat(self.current_path(path)).st_mode & 0o777
+        except FileNotFoundError:
+            current_hash = None
+            mode = 0o644
+        # Next to the snapshot, or next to the generations, so the rename stays local.
+        location = snapshot_location(path)
+        if location is None:
+            directory = os.path.dirname(path) or "."
+        else:
+            directory = os.path.join(location[0], GENERATIONS_DIR)
+        fd, tmp_path = tempfile.mkstemp(
+            dir=directory, prefix=f".{os.path.basename(path)}.", suffix=".tmp"
+        )
+        try:
+            new_hash = hashlib.sha256()
+            with os.fdopen(fd, "wb") as f:
+                for chunk in chunks:
+                    new_hash.update(chunk)
+                    f.write(chunk)
+                if new_hash.hexdigest() == current_hash:
+                    os.unlink(tmp_path)
+                    return False
+                f.flush()
+                os.fsync(f.fileno())
+            os.chmod(tmp_path, mode)
+            path = self.target_path(path)
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+            raise
+        self.dirty_dirs.add(os.path.dirname(path))
+        return True
+
+    def flush(self) -> None:
+        for directory in self.dirty_dirs:
+            fsync_dir(directory)
+        self.dirty_dirs.clear()
+        for root, staged in self.staging.items():
+            self.unpin(root)
+            lock_file = acquire_generation_lock(root)
+            try:
+                self.published[root] = publish_generation(
+                    root, staged, self.bases.pop(root), self.written.pop(root)
+                )
+            finally:
+                release_generation_lock(lock_file)
+        self.staging.clear()
+
+    def unpin(self, root) -> None:
+        views, previous = self.views.pop(root)
+        if previous is None:
+            views.pop(root, None)
+        else:
+            views[root] = previous
+
+    def discard(self) -> None:
+        """Drops the staged generations, the current ones stay published"""
+        for root, staged in self.staging.items():
+            self.unpin(root)
+            shutil.rmtree(staged, ignore_errors=True)
+        self.staging.clear()
+        self.bases.clear()
+        self.written.clear()
+        self.dirty_dirs.clear()
+
+
+@dataclass
+class StreamingConfigItem:
+    """High-cardinality config item pulled in pkid ordered chunks.
+
+    The sql must select the pkid as its first column and take the {first} and {after}
+    placeholders, so each chunk continues after the last pkid of the previous one. Memory
+    stays bounded by chunk_rows while fetching and by max_report_rows while diffing.
+    """
+
+    sql: str
+    # listChange object types whose changes refresh this item.
+    change_types: tuple
+    chunk_rows: int = 5000
+    # Seconds a full pull may take before it is abandoned and the old snapshot is kept.
+    time_budget: float = 900.0
+    # Serialised size of a single chunk. chunk_rows shrinks to fit it, and the pull is
+    # abandoned if a chunk of STREAMING_MIN_CHUNK_ROWS rows still doesn't.
+    memory_budget: int = 16 * 1024 * 1024
+    max_report_rows: int = 200
+
+
+@dataclass
+class RefreshPolicy:
+    """How the monitoring daemon keeps a config item up to date.
+
+    Change driven items are refreshed when listChange reports them or an item they
+    depend on. Items with an interval are also checked periodically, a change driven
+    template only compares its fingerprint then. Every item with a reconcile_interval
+    gets an unconditional full refresh that often. Lower priorities run first.
+    """
+
+    change_driven: bool = True
+    interval: float | None = 3600.0
+    reconcile_interval: float | None = 7 * 24 * 3600.0
+    priority: int = 50
+
+
+class RefreshScheduler:
+    """Decides which config items to refresh in each cycle of the monitoring daemon.
+
+    Due items are run in priority order until the cycle's time budget is spent, the
+    rest are carried over and go first in the next cycle, ahead of items due since.
+    """
+
+    def __init__(self, config_items, now):
+        self.config_items = list(config_items)
+        self.last_refresh = dict.fromkeys(self.config_items, now)
+        self.last_reconcile = dict.fromkeys(self.config_items, now)
+        self.pending = {}
+        # Items the budget of the last cycle didn't reach, in the order they were due.
+        self.carried = []
+
+    def mark_changed(self, config_items) -> None:
+        for item in config_items:
+            if get_refresh_policy(item).change_driven:
+                self.pending.setdefault(item, "change")
+
+    def collect_due(self, now) -> None:
+        for item in self.config_items:
+            policy = get_refresh_policy(item)
+            if (
+                policy.reconcile_interval is not None
+                and now - self.last_reconcile[item] >= policy.reconcile_interval
+            ):
+                self.pending[item] = "reconcile"
+            elif (
+                policy.interval is not None
+                and now - self.last_refresh[item] >= policy.interval
+            ):
+                self.pending.setdefault(item, "interval")
+
+    def next_due(self) -> float:
+        """Monotonic time at which the next periodic or reconciliation refresh is due"""
+        due = []
+        for item in self.config_items:
+            policy = get_refresh_policy(item)
+            if policy.interval is not None:
+                due.append(self.last_refresh[item] + policy.interval)
+            if policy.reconcile_interval is not None:
+                due.append(self.last_reconcile[item] + policy.reconcile_interval)
+        return min(due, default=float("inf"))
+
+    def run(self, refresh, budget) -> list:
+        """Calls refresh(item, reason) for pending items in priority order within budget"""
+        start = time.monotonic()
+        order = {item: index for index, item in enumerate(self.config_items)}
+        carried = [item for item in self.carried if item in self.pending]
+        queue = carried + sorted(
+            self.pending.keys() - set(carried),
+            key=lambda item: (get_refresh_policy(item).priority, order[item]),
+        )
+        done = []
+        for item in queue:
+            # Always make progress, even if a single item is larger than the budget.
+            if done and time.monotonic() - start >= budget:
+                break
+            reason = self.pending.pop(item)
+            refresh(item, reason)
+            now = time.monotonic()
+            self.last_refresh[item] = now
+            if reason == "reconcile":
+                self.last_reconcile[item] = now
+            done.append(item)
+        self.carried = queue[len(done) :]
+        return done
+
+
+@dataclass
+class ConfigDiff:
+    """Structured result of comparing the base and running snapshot of a config item"""
+
+    config_item: str
+    modified_columns: list = field(default_factory=list)
+    removed_rows: int = 0
+    added_rows: int = 0
+    html: str = ""
+    text: str = ""
+    full_diff_path: str = ""
+
+
+class FullDiffWriter:
+    """Streams every row of a diff into a gzip compressed CSV next to the snapshots.
+
+    The report only shows the first rows of each section, the complete diff is linked
+    from it instead. The file is named after the digest of its content, so the same diff
+    maps to the same file, and it is dropped again unless keep() was called. Old files
+    are pruned by the parent process with prune_reports, never by the diff workers.
+    """
+
+    def __init__(self, config_relative_path, config_item, header):
+        self.report_dir = os.path.join(config_relative_path, REPORT_DIR)
+        self.config_item = config_item
+        self.digest = hashlib.sha256()
+        self.keep_file = False
+        os.makedirs(self.report_dir, exist_ok=True)
+        fd, self.tmp_path = tempfile.mkstemp(dir=self.report_dir, suffix=".tmp")
+        self.file = io.TextIOWrapper(
+            gzip.GzipFile(fileobj=os.fdopen(fd, "wb"), mode="wb", mtime=0),
+            newline="",
+        )
+        self.csv_writer = csv.writer(self.file)
+        self.row("change", header)
+
+    def row(self, change, values) -> None:
+        values = [change, *values]
+        self.digest.update(repr(values).encode())
+        self.csv_writer.writerow(values)
+
+    def keep(self) -> None:
+        self.keep_file = True
+
+    def close(self) -> str:
+        """Returns the location of the full diff, or "" when it wasn't kept"""
+        self.file.close()
+        if not self.keep_file:
+            os.remove(self.tmp_path)
+            return ""
+        path = os.path.join(
+            self.report_dir,
+            f"{self.config_item}_{self.digest.hexdigest()[:16]}.csv.gz",
+        )
+        os.replace(self.tmp_path, path)
+        return os.path.abspath(path)
+
+
+class ProfileSpan:
+    """One open profiling span, placed in the sampled stacks under the frame opening it"""
+
+    def __init__(self, spans, name):
+        self.spans = spans
+        self.name = name
+
+    def __enter__(self):
+        frame = sys._getframe(1)
+        depth = 0
+        while frame is not None:
+            depth += 1
+            frame = frame.f_back
+        self.spans.append((depth, self.name))
+
+    def __exit__(self, exc_type, exc, tb):
+        self.spans.pop()
+
+
+class CycleProfiler:
+    """On demand wall clock profile of the monitoring loop, for a number of cycles.
+
+    Samples the stacks of the threads running a cycle, with their open spans, until
+    every monitored cluster ran that many cycles, then writes them as folded stacks.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.active = False
+        self.requested = 0
+        self.stop_requested = False
+        self.toggled = False
+        self.cycles = 0
+        # Names of the monitored clusters, None for the single cluster of list_change.
+        self.monitors = {None}
+        self.done = Counter()
+        self.counted = set()
+        self.cycle_threads = {}
+        self.spans = {}
+        self.samples = Counter()
+        self.stopped = threading.Event()
+        self.sampler = threading.Thread(target=self.sample, daemon=True)
+        self.output_dir = PROFILE_DIR
+        self.last_output = None
+
+    def span(self, name):
+        if not self.active:
+            return NO_SPAN
+        return ProfileSpan(self.spans.setdefault(threading.get_ident(), []), name)
+
+    def request(self, cycles) -> None:
+        """Profiles the next cycles, from the status service or the signal handler"""
+        self.requested = cycles
+
+    def request_stop(self) -> None:
+        self.stop_requested = True
+
+    def handle_signal(self, signum, frame) -> None:
+        # Only sets a flag, the capture starts or stops at the next cycle boundary.
+        self.toggled = True
+
+    def cycle_started(self, monitor=None) -> None:
+        with self.lock:
+            self.cycle_threads[threading.get_ident()] = monitor
+            if self.toggled and not self.active:
+                self.toggled = False
+                self.requested = self.requested or PROFILE_CYCLES
+            if self.requested and self.active:
+                self.cycles = self.requested
+                self.done.clear()
+                self.counted.clear()
+            elif self.requested:
+                self.start(self.requested)
+            self.requested = 0
+            if self.active:
+                self.counted.add(monitor)
+
+    def cycle_finished(self, monitor=None) -> None:
+        with self.lock:
+            self.cycle_threads.pop(threading.get_ident(), None)
+            if not self.active:
+                return
+            if monitor in self.counted:
+                self.counted.discard(monitor)
+                self.done[monitor] += 1
+            if self.stop_requested or self.toggled or self.cycles_left() <= 0:
+                self.stop()
+
+    def forget(self, monitor) -> None:
+        """Stops waiting for the cycles of a cluster that is no longer monitored"""
+        with self.lock:
+            self.monitors.discard(monitor)
+
+    def cycles_left(self) -> int:
+        return max(
+            (self.cycles - self.done[monitor] for monitor in self.monitors), default=0
+        )
+
+    def start(self, cycles) -> None:
+        self.cycles = cycles
+        self.done.clear()
+        self.counted.clear()
+        self.stop_requested = self.toggled = False
+        self.spans = {}
+        self.samples = Counter()
+        self.stopped.clear()
+        self.sampler = threading.Thread(target=self.sample, daemon=True)
+        self.sampler.start()
+        self.active = True
+        print(f"Profiling the next {cycles} cycles")
+
+    def stop(self) -> None:
+        self.active = False
+        self.stopped.set()
+        self.sampler.join()
+        os.makedirs(self.output_dir, exist_ok=True)
+        path = os.path.join(
+            self.output_dir, f"profile-{datetime.now():%Y%m%d-%H%M%S}.folded"
+        )
+        with SnapshotWriter() as writer:
+            writer.write(
+                path,
+                "".join(
+                    f"{stack} {count}\n"
+                    for stack, count in sorted(self.samples.items())
+                ).encode(),
+            )
+        self.last_output = os.path.abspath(path)
+        self.stop_requested = self.toggled = False
+        print(f"Profile of {sum(self.samples.values())} samples written to {path}")
+
+    def sample(self) -> None:
+        while not self.stopped.wait(PROFILE_SAMPLE_INTERVAL):
+            frames = sys._current_frames()
+            for ident in list(self.cycle_threads):
+                if ident in frames:
+                    spans = list(self.spans.get(ident, ()))
+                    self.samples[folded_stack(frames[ident], spans)] += 1
+
+    def state(self) -> dict:
+        return {
+            "active": self.active,
+            "cycles_left": self.cycles_left() if self.active else self.requested,
+            "samples": sum(self.samples.values()),
+            "last_output": self.last_output,
+        }
+
+
+def folded_stack(frame, spans) -> str:
+    """Root first stack of a frame with each span right under the frame that opened it"""
+    frames = []
+    while frame is not None:
+        frames.append(frame)
+        frame = frame.f_back
+    names = []
+    spans = iter(spans)
+    span = next(spans, None)
+    for depth, frame in enumerate(reversed(frames), 1):
+        code = frame.f_code
+        names.append(
+            f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+        )
+        while span is not None and span[0] <= depth:
+            names.append(span[1])
+            span = next(spans, None)
+    if span is not None:
+        names.append(span[1])
+    names.extend(name for _, name in spans)
+    return ";".join(names)
+
+
+def profile_span(name):
+    """Decorator running the function in a profiling span"""
+
+    def decorate(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            with PROFILER.span(name):
+                return function(*args, **kwargs)
+
+        return wrapper
+
+    return decorate
+
+
+class TrackerStatus:
+    """In-memory drift status and metrics of the monitoring daemon.
+
+    Updated by the refresh code and read by the status service threads, so every
+    access goes through the lock.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.started = datetime.now().isoformat(timespec="seconds")
+        self.error = None
+        self.items = {}
+        self.metrics = {
+            "listchange_polls": 0,
+            "changes_received": 0,
+            "sql_queries": 0,
+            "emails_sent": 0,
+            "refresh_errors": 0,
+            "last_cycle_seconds": 0.0,
+        }
+
+    def record_refresh(self, config_item, diff, refreshed=None) -> None:
+        refreshed = refreshed or datetime.now()
+        with self.lock:
+            self.items[config_item] = {
+                "last_refresh": refreshed.isoformat(timespec="seconds"),
+                "drift": bool(diff.html),
+                "modified_columns": diff.modified_columns,
+                "removed_rows": diff.removed_rows,
+                "added_rows": diff.added_rows,
+            }
+
+    def incr(self, metric, value=1) -> None:
+        with self.lock:
+            self.metrics[metric] += value
+
+    def set(self, metric, value) -> None:
+        with self.lock:
+            self.metrics[metric] = value
+
+    def fail(self, error) -> None:
+        """Marks the cluster as no longer monitored"""
+        with self.lock:
+            self.error = error
+
+    def drift(self) -> list:
+        with self.lock:
+            return sorted(item for item, state in self.items.items() if state["drift"])
+
+    def snapshot(self) -> dict:
+        with self.lock:
+            return {
+                "started": self.started,
+                "error": self.error,
+                "items": {item: dict(state) for item, state in self.items.items()},
+                "metrics": dict(self.metrics),
+            }
+
+
+class StatusRequestHandler(BaseHTTPRequestHandler):
+    """Serves the daemon's in-memory status as JSON on the local status port.
+
+    With several clusters the drift list names items as "cluster:item" and the status
+    and metrics are reported per cluster.
+    """
+
+    def do_GET(self):
+        statuses = self.server.statuses  # pyright: ignore[reportAttributeAccessIssue]
+        if self.path == "/drift":
+            drift = [
+                f"{name}:{item}" if name else item
+                for name, status in statuses.items()
+                for item in status.drift()
+            ]
+            body = {"drift": drift, "exit_code": 1 if drift else 0}
+        elif self.path in ("/metrics", "/status"):
+            snapshots = {name: status.snapshot() for name, status in statuses.items()}
+            if self.path == "/metrics":
+                snapshots = {name: snap["metrics"] for name, snap in snapshots.items()}
+            body = snapshots.get(None) or {"clusters": snapshots}
+        elif self.path == "/profile":
+            body = PROFILER.state()
+        else:
+            self.send_error(404)
+            return
+        self.send_json(body)
+
+    def do_POST(self):
+        url = urllib.parse.urlsplit(self.path)
+        if url.path == "/profile":
+            query = urllib.parse.parse_qs(url.query)
+            try:
+                cycles = int(query.get("cycles", [PROFILE_CYCLES])[0])
+            except ValueError:
+                cycles = 0
+            if cycles < 1:
+                self.send_error(400, "cycles must be a number of at least 1")
+                return
+            PROFILER.request(cycles)
+        elif url.path == "/profile/stop":
+            PROFILER.request_stop()
+        else:
+            self.send_error(404)
+            return
+        self.send_json(PROFILER.state())
+
+    def send_json(self, body):
+        data = json.dumps(body).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        logging.debug(format, *args)
+
+
+@dataclass
+class ChangeEvent:
+    """One changed tag of a listChange change, or the change itself if it has no tags"""
+
+    logged_at: str
+    queue_id: str
+    action: str
+    doget: str
+    type: str
+    uuid: str
+    field: str | None = None
+    value: str | None = None
+    tag_index: int = 0
+
+
+class ChangeLog:
+    """Indexed store of every listChange event, kept in SQLite in WAL mode.
+
+    Events are appended in one transaction per poll and can be queried by type, uuid,
+    field and time without re-reading anything else.
+    """
+
+    def __init__(self, config_relative_path):
+        self.conn = sqlite3.connect(
+            os.path.join(config_relative_path, CHANGE_LOG_DB), check_same_thread=False
+        )
+        self.conn.execute("pragma journal_mode=wal")
+        self.conn.execute("pragma synchronous=normal")
+        self.conn.executescript(
+            """
+            create table if not exists change_event (
+                id integer primary key,
+                logged_at text not null,
+                queue_id text,
+                action text,
+                doget text,
+                type text,
+                uuid text,
+                field text,
+                value text
+            );
+            create index if not exists change_event_type on change_event (type, logged_at);
+            create index if not exists change_event_uuid on change_event (uuid, logged_at);
+            create index if not exists change_event_field on change_event (field, logged_at);
+            create index if not exists change_event_logged_at on change_event (logged_at);
+            """
+        )
+
+    def write(self, events) -> None:
+        with self.conn:
+            self.conn.executemany(
+                "insert into change_event (logged_at, queue_id, action, doget, type, uuid, field, value) "
+                "values (?, ?, ?, ?, ?, ?, ?, ?)",
+                [
+                    (
+                        e.logged_at,
+                        e.queue_id,
+                        e.action,
+                        e.doget,
+                        e.type,
+                        e.uuid,
+                        e.field,
+                        e.value,
+                    )
+                    for e in events
+                ],
+            )
+
+    def query(
+        self, *, type=None, uuid=None, field=None, since=None, until=None, limit=None
+    ) -> list:
+        clauses = []
+        params = []
+        for column, value in (("type", type), ("uuid", uuid), ("field", field)):
+            if value is not None:
+                clauses.append(f"{column} = ?")
+                params.append(value)
+        if since is not None:
+            clauses.append("logged_at >= ?")
+            params.append(since)
+        if until is not None:
+            clauses.append("logged_at < ?")
+            params.append(until)
+        sql = "select logged_at, action, doget, type, uuid, field, value from change_event"
+        if clauses:
+            sql += " where " + " and ".join(clauses)
+        sql += " order by logged_at desc, id desc"
+        if limit:
+            sql += " limit ?"
+            params.append(limit)
+        return self.conn.execute(sql, params).fetchall()
+
+    def close(self) -> None:
+        self.conn.close()
+
+
+class DialPlanIndex:
+    """Reference graph of the dial plan built from the running config snapshots.
+
+    Edges follow the call routing, from a CSS to its partitions, the patterns in them,
+    the route lists and route groups they use and the devices of those, and from device
+    pools and translation patterns to the CSSs they use. The edges of each snapshot are
+    replaced only when its content hash changed, and reachability and reverse reference
+    queries are recursive SQL over the indexed edges.
+    """
+
+    def __init__(self, config_relative_path):
+        self.config_relative_path = config_relative_path
+        self.conn = sqlite3.connect(
+            os.path.join(config_relative_path, DIAL_PLAN_INDEX_DB),
+            check_same_thread=False,
+        )
+        self.conn.execute("pragma journal_mode=wal")
+        self.conn.execute("pragma synchronous=normal")
+        self.conn.executescript(
+            """
+            create table if not exists edge (
+                src text not null,
+                dst text not null,
+                item text not null,
+                src_name text not null,
+                dst_name text not null
+            );
+            create index if not exists edge_src on edge (src);
+            create index if not exists edge_dst on edge (dst);
+            create index if not exists edge_src_name on edge (src_name);
+            create index if not exists edge_dst_name on edge (dst_name);
+            create index if not exists edge_item on edge (item);
+            create table if not exists indexed_item (item text primary key, hash text not null);
+            """
+        )
+        (version,) = self.conn.execute("pragma user_version").fetchone()
+        if version != DIAL_PLAN_INDEX_VERSION:
+            with self.conn:
+                self.conn.execute("delete from edge")
+                self.conn.execute("delete from indexed_item")
+                self.conn.execute(f"pragma user_version = {DIAL_PLAN_INDEX_VERSION}")
+
+    def update(self, config_items=None) -> list:
+        """Re-indexes the snapshots that changed since they were last indexed"""
+        indexed = dict(self.conn.execute("select item, hash from indexed_item"))
+        updated = []
+        for item in config_items or dial_plan_edges:
+            if item not in dial_plan_edges:
+                continue
+            try:
+                running_hash = snapshot_digest(
+                    "runningconfig", self.config_relative_path, item
+                )
+            except FileNotFoundError:
+                continue
+            if indexed.get(item) == running_hash:
+                continue
+            with open(
+                get_config_relative_path(
+                    "runningconfig", self.config_relative_path, item
+                ),
+                newline="",
+            ) as f:
+                edges = {
+                    (src, dst)
+                    for row in csv.DictReader(f)
+                    for src, dst in dial_plan_edges[item](row)
+                    if src and dst and not src.endswith(":") and not dst.endswith(":")
+                }
+            with self.conn:
+                self.conn.execute("delete from edge where item = ?", (item,))
+                self.conn.executemany(
+                    "insert into edge (src, dst, item, src_name, dst_name) values (?, ?, ?, ?, ?)",
+                    [
+                        (src, dst, item, src.split(":", 1)[1], dst.split(":", 1)[1])
+                        for src, dst in edges
+                    ],
+                )
+                self.conn.execute(
+                    "insert or replace into indexed_item (item, hash) values (?, ?)",
+                    (item, running_hash),
+                )
+            updated.append(item)
+        return updated
+
+    def resolve(self, name) -> list:
+        """Index nodes called name, which may leave out the kind, ex: PT_Internal"""
+        if ":" in name and name.split(":", 1)[0] in DIAL_PLAN_KINDS:
+            return [name]
+        return [
+            node
+            for (node,) in self.conn.execute(
+                "select src from edge where src_name = ?1 "
+                "union select dst from edge where dst_name = ?1",
+                (name,),
+            )
+        ]
+
+    def closure(self, nodes, reverse=False) -> list:
+        """Every node reachable from nodes, or referencing them when reverse is set"""
+        src, dst = ("dst", "src") if reverse else ("src", "dst")
+        placeholders = ", ".join("?" * len(nodes))
+        rows = self.conn.execute(
+            f"""
+            with recursive reached (node) as (
+                select {dst} from edge where {src} in ({placeholders})
+                union
+                select edge.{dst} from edge join reached on edge.{src} = reached.node
+            )
+            select node from reached order by node
+            """,
+            nodes,
+        )
+        # The dn: nodes only join patterns to route lists, they aren't config items.
+        return [node for (node,) in rows if not node.startswith("dn:")]
+
+    def close(self) -> None:
+        self.conn.close()
+
+
+class ConsoleChangeSink:
+    """Prints listChange events in the list_changes table layout, one write per poll"""
+
+    actions = {"a": "Add", "u": "Update", "r": "Remove"}
+
+    def __init__(self):
+        print(f"Action doGet? Type{16 * ' '} UUID{32 * ' '} Field{10 * ' '} Value")
+        print(f"{6 * '-'} {6 * '-'} {20 * '-'} {36 * '-'} {15 * '-'} {15 * '-'}")
+
+    def write(self, events) -> None:
+        out = io.StringIO()
+        for e in events:
+            # The first changedTag of a change gets a full line of data, the following
+            # ones just the field/value part of the line.
+            if e.tag_index:
+                print(71 * " ", e.field.ljust(15, " "), e.value, file=out)
+            elif e.field is not None:
+                print(
+                    self.actions[e.action].ljust(6, " "),
+                    e.doget.ljust(6, " "),
+                    e.type.ljust(20, " "),
+                    e.uuid,
+                    e.field.ljust(15, " "),
+                    e.value,
+                    file=out,
+                )
+            else:
+                print(
+                    self.actions[e.action].ljust(6, " "),
+                    e.doget.ljust(6, " "),
+                    e.type.ljust(20, " "),
+                    e.uuid,
+                    file=out,
+                )
+        sys.stdout.write(out.getvalue())
+        sys.stdout.flush()
+
+    def close(self) -> None:
+        pass
+
+
 DEBUG = False
 
+# Archive recording or replaying the AXL and CLI traffic, set by --record/--replay.
+TRAFFIC = None
+# Bumped when the archive format changes, older archives can't be replayed.
+TRAFFIC_ARCHIVE_VERSION = 2
+
+AXL_SETTINGS = Settings(strict=False, xml_huge_tree=True)  # pyright: ignore[reportCallIssue]
+
+# Every listChange event is appended to this SQLite database under the config path.
+CHANGE_LOG_DB = "changelog.db"
+
+DIAL_PLAN_INDEX_DB = "dialplan.db"
+# Bumped when the edges derived from a snapshot change, so they are indexed again.
+DIAL_PLAN_INDEX_VERSION = 2
+
+# State served by the local status service, on the STATUS_PORT of cucmstatus.py.
+STATUS = TrackerStatus()
+
+# Profiles of the monitoring loop are requested with this signal, or POST /profile on
+# the status service, and written under PROFILE_DIR in the config relative path.
+PROFILE_SIGNAL = signal.SIGUSR2
+PROFILE_CYCLES = 10
+PROFILE_SAMPLE_INTERVAL = 0.005
+PROFILE_DIR = "profiles"
+NO_SPAN = contextlib.nullcontext()
+PROFILER = CycleProfiler()
+
+# Seconds between listChange polls and the time budget of one refresh cycle.
+LISTCHANGE_POLL_INTERVAL = 600.0
+REFRESH_CYCLE_BUDGET = 300.0
+
+# Seconds a template fingerprint may stand in for a full pull, the default reconcile
+# interval. It doesn't see rows modified in place, the daemon relies on listChange
+# reporting those.
+FINGERPRINT_MAX_AGE = 7 * 86400.0
+
+# Seconds an AXL read node that failed stays out of the rotation, and the query
+# probing it before it comes back.
+AXL_NODE_RETRY = 300.0
+AXL_PROBE_SQL = "select count(*) from processnode"
+
+# Diffs are cached on disk under the config relative path, keyed by the content hash of
+# the base and running snapshot. Bump the version whenever the diff output changes.
+DIFF_CACHE_DIR = ".diffcache"
+DIFF_CACHE_SIZE = 256
+DIFF_CACHE_VERSION = 5
+
+# Snapshot hashes of every config item as of its last diff, and the base config
+# generation. update_base takes the changed items from it instead of re-diffing.
+MANIFEST_FILE = "manifest.json"
+MANIFEST_LOCK = threading.Lock()
+
+# Snapshots are published as generations/gen-NNNNNN directories, the current symlink
+# points at the latest. Superseded generations are kept GENERATION_MIN_AGE seconds
+# for the readers still pinned to them.
+SNAPSHOT_DIRS = ("baseconfig", "runningconfig")
+GENERATIONS_DIR = "generations"
+CURRENT_GENERATION = "current"
+GENERATION_KEEP = 10
+GENERATION_MIN_AGE = 600.0
+GENERATION_ROOTS = set()
+SNAPSHOT_VIEWS = threading.local()
+# Empty CSV templates shipped with the script, the base of an item that has none yet.
+TEMPLATE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "template")
+
+# XML documents of the blob_columns are stored once per canonical form in BLOB_DIR and
+# referenced from the snapshots by their hash.
+BLOB_DIR = "blobs"
+BLOB_PREFIX = "c14n-sha256:"
+
+# Rows shown per section of a change report, the full diff of a larger change is
+# written to a compressed CSV in REPORT_DIR and linked from the report instead.
+REPORT_MAX_ROWS = 200
+REPORT_DIR = "reports"
+# At least one per diff cache entry, so cached diffs don't link to pruned files.
+REPORT_KEEP = DIFF_CACHE_SIZE
+
+# Streaming pulls hand chunks to the snapshot writer in pieces of this many bytes, and
+# never shrink a chunk below STREAMING_MIN_CHUNK_ROWS rows.
+STREAMING_PIECE_SIZE = 1024 * 1024
+STREAMING_MIN_CHUNK_ROWS = 100
+
 
 def does_last_response_report_credential_error(history) -> bool:
     """Analyses the response for credential error"""
     return "HTTP Status 401" in ET.tostring(history.last_received["envelope"]).decode()
 
 
+def fsync_dir(directory) -> None:
+    fd = os.open(directory, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def snapshot_location(path) -> tuple | None:
+    """(config relative path, which config, file name) of a snapshot file, else None"""
+    parts = Path(path)
+    which_config = parts.parent.name
+    generation = parts.parent.parent
+    if which_config not in SNAPSHOT_DIRS:
+        return None
+    if generation.name == CURRENT_GENERATION:
+        return str(generation.parent), which_config, parts.name
+    if generation.parent.name == GENERATIONS_DIR and generation.name.startswith(
+        ("gen-", ".staging-")
+    ):
+        return str(generation.parent.parent), which_config, parts.name
+    return None
+
+
+def acquire_generation_lock(config_relative_path) -> Any:
+    lock_file = open(os.path.join(config_relative_path, GENERATIONS_DIR, ".lock"), "a")
+    fcntl.flock(lock_file, fcntl.LOCK_EX)
+    return lock_file
+
+
+def release_generation_lock(lock_file) -> None:
+    fcntl.flock(lock_file, fcntl.LOCK_UN)
+    lock_file.close()
+
+
+def generation_number(name) -> int:
+    return int(name.removeprefix("gen-"))
+
+
+def generation_files(directory) -> set:
+    if not os.path.isdir(directory):
+        return set()
+    return {
+        entry.name
+        for entry in os.scandir(directory)
+        if entry.is_file() and not entry.name.startswith(".")
+    }
+
+
+def stage_generation(config_relative_path) -> tuple:
+    """Hard links the current generation into a new staging directory.
+
+    Takes no lock, publish_generation catches up with the generations published in the
+    meantime. Returns the staging directory and the generation it was staged from.
+    """
+    generations = os.path.join(config_relative_path, GENERATIONS_DIR)
+    current = os.path.realpath(os.path.join(config_relative_path, CURRENT_GENERATION))
+    staged = tempfile.mkdtemp(dir=generations, prefix=".staging-")
+    for which_config in SNAPSHOT_DIRS:
+        os.makedirs(os.path.join(staged, which_config))
+        source = os.path.join(current, which_config)
+        for name in generation_files(source):
+            os.link(
+                os.path.join(source, name), os.path.join(staged, which_config, name)
+            )
+    return staged, current
+
+
+def rebase_generation(staged, current, written) -> None:
+    """Brings the files a writer didn't write up to date with the current generation"""
+    for which_config in SNAPSHOT_DIRS:
+        source = os.path.join(current, which_config)
+        target = os.path.join(staged, which_config)
+        names = generation_files(source)
+        for name in names:
+            if (which_config, name) in written:
+                continue
+            tmp_path = os.path.join(target, f".{name}.rebase")
+            os.link(os.path.join(source, name), tmp_path)
+            os.replace(tmp_path, os.path.join(target, name))
+        for name in generation_files(target) - names:
+            if (which_config, name) not in written:
+                os.remove(os.path.join(target, name))
+
+
+def publish_generation(config_relative_path, staged, base=None, written=()) -> int:
+    """Makes a staged generation the current one, returns its number.
+
+    The caller holds the generation lock. If another writer published a generation
+    since base was staged, the files this writer didn't write are taken from it.
+    """
+    generations = os.path.join(config_relative_path, GENERATIONS_DIR)
+    current = os.path.realpath(os.path.join(config_relative_path, CURRENT_GENERATION))
+    if base is not None and current != base:
+        rebase_generation(staged, current, written)
+    for which_config in SNAPSHOT_DIRS:
+        fsync_dir(os.path.join(staged, which_config))
+    number = 1 + max(
+        (
+            generation_number(entry.name)
+            for entry in os.scandir(generations)
+            if entry.name.startswith("gen-")
+        ),
+        default=0,
+    )
+    name = f"gen-{number:06d}"
+    os.rename(staged, os.path.join(generations, name))
+    fsync_dir(generations)
+    link = os.path.join(
+        config_relative_path, f".{CURRENT_GENERATION}.{os.getpid()}.tmp"
+    )
+    if os.path.lexists(link):
+        os.remove(link)
+    os.symlink(os.path.join(GENERATIONS_DIR, name), link)
+    os.replace(link, os.path.join(config_relative_path, CURRENT_GENERATION))
+    fsync_dir(config_relative_path)
+    prune_generations(config_relative_path)
+    return number
+
+
+def prune_generations(config_relative_path) -> None:
+    """Removes the old generations no reader can still be using.
+
+    A generation is kept GENERATION_MIN_AGE seconds after it was superseded, which is
+    when the next generation was staged, and staging directories left by a writer
+    that died are removed after the same time.
+    """
+    generations = os.path.join(config_relative_path, GENERATIONS_DIR)
+    current = os.path.basename(
+        os.path.realpath(os.path.join(config_relative_path, CURRENT_GENERATION))
+    )
+    entries = sorted(
+        (entry for entry in os.scandir(generations) if entry.name.startswith("gen-")),
+        key=lambda entry: generation_number(entry.name),
+    )
+    now = time.time()
+    for entry, superseding in zip(entries[:-GENERATION_KEEP], entries[1:]):
+        if (
+            entry.name != current
+            and now - superseding.stat().st_mtime > GENERATION_MIN_AGE
+        ):
+            shutil.rmtree(entry.path, ignore_errors=True)
+    for entry in os.scandir(generations):
+        if entry.name.startswith(".staging-") and all(
+            now - os.stat(path).st_mtime > GENERATION_MIN_AGE
+            for path in [
+                entry.path,
+                *(os.path.join(entry.path, which) for which in SNAPSHOT_DIRS),
+            ]
+            if os.path.exists(path)
+        ):
+            shutil.rmtree(entry.path, ignore_errors=True)
+    prune_blobs(config_relative_path)
+
+
+def prune_blobs(config_relative_path) -> None:
+    """Removes the blobs no generation references anymore.
+
+    Blobs younger than GENERATION_MIN_AGE are kept, they may belong to a generation
+    being staged.
+    """
+    blob_dir = os.path.join(config_relative_path, BLOB_DIR)
+    if not os.path.isdir(blob_dir):
+        return
+    referenced = set()
+    generations = os.path.join(config_relative_path, GENERATIONS_DIR)
+    for generation in os.scandir(generations):
+        for which_config in SNAPSHOT_DIRS:
+            for item in blob_columns:
+                try:
+                    with open(
+                        os.path.join(generation.path, which_config, item + ".csv")
+                    ) as f:
+                        referenced.update(
+                            re.findall(BLOB_PREFIX + r"([0-9a-f]{64})", f.read())
+                        )
+                except (FileNotFoundError, NotADirectoryError):
+                    continue
+    for entry in os.scandir(blob_dir):
+        if (
+            entry.name.removesuffix(".xml") not in referenced
+            and time.time() - entry.stat().st_mtime > GENERATION_MIN_AGE
+        ):
+            try:
+                os.remove(entry.path)
+            except FileNotFoundError:
+                pass
+
+
+def ensure_generations(config_relative_path) -> None:
+    """Moves the snapshot directories of an older layout into the first generation.
+
+    baseconfig and runningconfig are left as symlinks into the current generation, so
+    they can still be browsed and the initial setup still works.
+    """
+    if config_relative_path in GENERATION_ROOTS:
+        return
+    current = os.path.join(config_relative_path, CURRENT_GENERATION)
+    if not os.path.lexists(current):
+        os.makedirs(os.path.join(config_relative_path, GENERATIONS_DIR), exist_ok=True)
+        lock_file = acquire_generation_lock(config_relative_path)
+        try:
+            if not os.path.lexists(current):
+                staged, _ = stage_generation(config_relative_path)
+                for which_config in SNAPSHOT_DIRS:
+                    legacy = os.path.join(config_relative_path, which_config)
+                    if os.path.isdir(legacy) and not os.path.islink(legacy):
+                        for entry in os.scandir(legacy):
+                            if entry.is_file():
+                                os.link(
+                                    entry.path,
+                                    os.path.join(staged, which_config, entry.name),
+                                )
+                publish_generation(config_relative_path, staged)
+            for which_config in SNAPSHOT_DIRS:
+                legacy = os.path.join(config_relative_path, which_config)
+                if os.path.isdir(legacy) and not os.path.islink(legacy):
+                    os.rename(legacy, f"{legacy}.pre-generations")
+                    shutil.rmtree(f"{legacy}.pre-generations")
+                if not os.path.lexists(legacy):
+                    os.symlink(os.path.join(CURRENT_GENERATION, which_config), legacy)
+        finally:
+            release_generation_lock(lock_file)
+    GENERATION_ROOTS.add(config_relative_path)
+    seed_base_snapshots(config_relative_path)
+
+
+def seed_base_snapshots(config_relative_path) -> None:
+    """Publishes the empty template of the tracked items that have no base config yet.
+
+    Ex: the streaming items, after upgrading an install set up before they existed.
+    """
+    base_dir = os.path.join(config_relative_path, CURRENT_GENERATION, "baseconfig")
+    with SnapshotWriter() as writer:
+        for config_item in [*templates, *streaming_templates]:
+            base_path = os.path.join(base_dir, config_item + ".csv")
+            if os.path.exists(base_path):
+                continue
+            try:
+                with open(os.path.join(TEMPLATE_DIR, config_item + ".csv"), "rb") as f:
+                    content = f.read()
+            except FileNotFoundError:
+                print(f"No base config or template for {config_item}")
+                continue
+            print(f"Starting the base config of {config_item} from its empty template")
+            writer.write(base_path, content)
+
+
+@contextlib.contextmanager
+def snapshot_view(config_relative_path, generation=None):
+    """Pins the snapshots read by the current thread to one generation.
+
+    Reads of the base and running configs within the block all come from the same
+    generation, however many new generations are published meanwhile. That is the
+    given one, else the one the thread is already pinned to, else the current one.
+    Yields the generation directory.
+    """
+    ensure_generations(config_relative_path)
+    views = SNAPSHOT_VIEWS.__dict__.setdefault("pinned", {})
+    previous = views.get(config_relative_path)
+    generation = (
+        generation
+        or previous
+        or os.path.realpath(os.path.join(config_relative_path, CURRENT_GENERATION))
+    )
+    views[config_relative_path] = generation
+    try:
+        yield generation
+    finally:
+        if previous is None:
+            del views[config_relative_path]
+        else:
+            views[config_relative_path] = previous
+
+
 def get_config_relative_path(which_config, config_relative_path, config_item) -> str:
-    path = config_relative_path
+    ensure_generations(config_relative_path)
+    pinned = getattr(SNAPSHOT_VIEWS, "pinned", {}).get(config_relative_path)
+    path = pinned or os.path.join(config_relative_path, CURRENT_GENERATION)
     config_path = os.path.join(path, which_config, config_item) + ".csv"
     return config_path
 
 
-def email(*, cucmpub, email_recipient, subject, body) -> None:
+@profile_span("email")
+def email(*, cucmpub, email_recipient, subject, body, status=STATUS) -> None:
+    status.incr("emails_sent")
     subprocess.run(
         [
             "swiss",
@@ -125,160 +1562,951 @@ def email(*, cucmpub, email_recipient, subject, body) -> None:
     )
 
 
-def compare_running_with_base(config_relative_path, config_item) -> str:
-    df1 = pd.read_csv(
-        get_config_relative_path("baseconfig", config_relative_path, config_item),
-        index_col=False,
-    ).replace(np.nan, "")
-    df2 = pd.read_csv(
-        get_config_relative_path("runningconfig", config_relative_path, config_item),
-        index_col=False,
-    ).replace(np.nan, "")
-    htmldiff = ""
-    changed_index = []
-    if df2.equals(df1):
-        logging.info(f"No changes were detected in {config_item}")
-    else:
-        try:
-            # pandas compare method compares only two dataframes of same number of colummns and rows.
-            # This block is used to show changes in the existing rows, not add/remove.
-            diff = df1.compare(df2.reset_index(drop=True), keep_equal=True).replace(
-                np.nan, ""
-            )
-            diff = diff.rename(
-                columns={"self": "baseconfig", "other": "running_config"}
+def diff_running_with_base(
+    config_relative_path, config_item, generation=None
+) -> ConfigDiff:
+    """Compares the base and running snapshot of one config item.
+
+    Runs in the diff worker processes, so it only takes file locations and returns the
+    rendered html and console output instead of printing it.
+
+    generation pins both snapshots to one generation, the current one by default.
+    """
+    with snapshot_view(config_relative_path, generation):
+        if config_item in streaming_templates:
+            return diff_streaming_item(config_relative_path, config_item)
+        df1 = pd.read_csv(
+            get_config_relative_path("baseconfig", config_relative_path, config_item),
+            index_col=False,
+        ).replace(np.nan, "")
+        df2 = pd.read_csv(
+            get_config_relative_path(
+                "runningconfig", config_relative_path, config_item
+            ),
+            index_col=False,
+        ).replace(np.nan, "")
+        # Snapshots taken before the blobs were moved out of line still hold the XML.
+        # They are compared by reference too, and the documents are kept in memory for
+        # the report, only the fetch path writes blobs.
+        documents = {}
+
+        def inline_reference(value):
+            reference = blob_reference(value)
+            if reference is not value:
+                documents[reference] = value
+            return reference
+
+        for column in blob_columns.get(config_item, ()):
+            for frame in (df1, df2):
+                if column in frame:
+                    frame[column] = frame[column].map(inline_reference)
+        htmldiff = ""
+        changed_index = []
+        removed_rows = added_rows = 0
+        full_diff_path = ""
+        out = io.StringIO()
+        if df2.equals(df1):
+            logging.info(f"No changes were detected in {config_item}")
+        else:
+            try:
+                # pandas compare method compares only two dataframes of same number of colummns and rows.
+                # This block is used to show changes in the existing rows, not add/remove.
+                diff = df1.compare(df2.reset_index(drop=True), keep_equal=True).replace(
+                    np.nan, ""
+                )
+                diff = diff.rename(
+                    columns={"self": "baseconfig", "other": "running_config"}
+                )
+                changed_index.append((diff.columns.get_level_values(0).to_list())[1::2])
+                htmldiff += f" <br />Following parameters have been modified in {config_item}: {changed_index} <br />"
+                print(
+                    f"\n\nFollowing parameters have been modified in the {config_item}: {changed_index} \n",
+                    file=out,
+                )
+                htmldiff += render_column_summary(
+                    out,
+                    config_item,
+                    {
+                        column: int(
+                            (
+                                diff[column]["baseconfig"]
+                                != diff[column]["running_config"]
+                            ).sum()
+                        )
+                        for column in changed_index[0]
+                    },
+                )
+            except Exception:
+                pass
+            # left_only merge will show the data present in base config, but missing in running config.
+            # Ex: some configurations was removed from CUCM, but not updated in base config.
+            baseconfig = df1.merge(
+                df2.reset_index(drop=True), indicator=True, how="left"
             )
-            changed_index.append((diff.columns.get_level_values(0).to_list())[1::2])
-            htmldiff += f" <br />Following parameters have been modified in {config_item}: {changed_index} <br />"
-            print(
-                f"\n\nFollowing parameters have been modified in the {config_item}: {changed_index} \n"
+            base_config = (baseconfig[baseconfig["_merge"] == "left_only"]).drop(
+                columns="_merge"
             )
-        except Exception:
+            # right_only merge will show the data present in running_config, but missing in base config.
+            # Ex: some configurations was added in CUCM, but not updated in base config.
+            runningconfig = df1.merge(df2, indicator=True, how="right")
+            running_config = (
+                runningconfig[runningconfig["_merge"] == "right_only"]
+            ).drop(columns="_merge")
+            removed_rows = base_config.shape[0]
+            added_rows = running_config.shape[0]
+
+            # Only the first REPORT_MAX_ROWS rows of a section are rendered, a larger change
+            # is written out in full and linked from the report.
+            cap = REPORT_MAX_ROWS
+
+            def write_full_diff():
+                full_diff = FullDiffWriter(
+                    config_relative_path, config_item, list(df1.columns)
+                )
+                for row in base_config.itertuples(index=False):
+                    full_diff.row("removed", row)
+                for row in running_config.itertuples(index=False):
+                    full_diff.row("added", row)
+                full_diff.keep()
+                return full_diff.close()
+
+            if max(removed_rows, added_rows) > cap:
+                full_diff_path = write_full_diff()
+
+            # Shape gives tuple of (num_of_rows, num_of_cols).
+            # columns will always remains same, it is the predefined parameters that we are pulling from CUCM. check only rows to identify the change was
+            # happened in baseconfig or running config.
+            if (((base_config.values).shape[0]) != 0) & (
+                ((running_config.values).shape[0]) == 0
+            ):
+                # Base config value is non zero, it means after removing the common items from baseconfig and runningconfig, baseconfig still has some rows,
+                # so something was removed in the CUCM, but not updated in the base config.
+                htmldiff += render_rows(
+                    out,
+                    f"<br />Changes detected in '{config_item}'. <br /> Below configs have been removed: <br />",
+                    base_config.head(cap).values.tolist(),
+                    base_config.columns,
+                    removed_rows,
+                )
+            elif (((running_config.values).shape[0]) != 0) & (
+                ((base_config.values).shape[0]) == 0
+            ):
+                # similar to the above condition, after merging runningconfig still has some extra rows, it means some config was added in CUCM, but not updated in
+                # base config.
+                htmldiff += render_rows(
+                    out,
+                    f"<br />Changes detected in '{config_item}'. <br /> Below configs have been added: <br />",
+                    running_config.head(cap).values.tolist(),
+                    running_config.columns,
+                    added_rows,
+                )
+            else:
+                # This final else statement covers both the scenario of some configs were added/removed and also the existing data was modified.
+                index = base_config.columns[0]
+                base_config_columns = base_config.columns
+                running_config_columns = running_config.columns
+                if changed_index:
+                    if index not in changed_index[0]:
+                        base_config_columns = changed_index[0].copy()
+                        running_config_columns = changed_index[0].copy()
+                        base_config_columns.insert(0, base_config.columns[0])
+                        running_config_columns.insert(0, running_config.columns[0])
+                htmldiff += render_rows(
+                    out,
+                    f"<br />Base configs and running configs has been modified for '{config_item}'. "
+                    "<br />Configs in Base Repo: <br />",
+                    base_config[base_config_columns].head(cap).values.tolist(),
+                    base_config_columns,
+                    removed_rows,
+                )
+                htmldiff += render_rows(
+                    out,
+                    "<br />Configs in Running Config: <br />",
+                    running_config[running_config_columns].head(cap).values.tolist(),
+                    running_config_columns,
+                    added_rows,
+                )
+            if removed_rows and added_rows:
+                xml_html, hidden = render_xml_changes(
+                    out,
+                    config_relative_path,
+                    config_item,
+                    base_config,
+                    running_config,
+                    documents,
+                )
+                htmldiff += xml_html
+                # Element changes that didn't fit are only in the full diff.
+                if hidden and not full_diff_path:
+                    full_diff_path = write_full_diff()
+            htmldiff += render_full_diff_link(out, full_diff_path)
+        return ConfigDiff(
+            config_item=config_item,
+            modified_columns=changed_index[0] if changed_index else [],
+            removed_rows=removed_rows,
+            added_rows=added_rows,
+            html=htmldiff,
+            text=out.getvalue(),
+            full_diff_path=full_diff_path,
+        )
+
+
+def compare_running_with_base(config_relative_path, config_item) -> str:
+    diff = get_config_diff(config_relative_path, config_item)
+    print(diff.text, end="")
+    return diff.html
+
+
+def snapshot_digest(which_config, config_relative_path, config_item) -> str:
+    with open(
+        get_config_relative_path(which_config, config_relative_path, config_item), "rb"
+    ) as f:
+        return hashlib.file_digest(f, "sha256").hexdigest()
+
+
+def get_diff_cache_path(config_relative_path, config_item, base_hash, running_hash):
+    key = f"{DIFF_CACHE_VERSION}:{config_item}:{base_hash}:{running_hash}"
+    digest = hashlib.sha256(key.encode()).hexdigest()
+    return os.path.join(config_relative_path, DIFF_CACHE_DIR, digest + ".json")
+
+
+def load_cached_diff(cache_path) -> ConfigDiff | None:
+    try:
+        with open(cache_path) as f:
+            diff = ConfigDiff(**json.load(f))
+    except (OSError, ValueError, TypeError):
+        return None
+    # Touch the entry, eviction drops the least recently used entries first. The full
+    # diff it links to is touched too, so it outlives the entry.
+    os.utime(cache_path)
+    if diff.full_diff_path and os.path.exists(diff.full_diff_path):
+        os.utime(diff.full_diff_path)
+    return diff
+
+
+def store_cached_diff(cache_path, diff) -> None:
+    cache_dir = os.path.dirname(cache_path)
+    os.makedirs(cache_dir, exist_ok=True)
+    tmp_path = f"{cache_path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(asdict(diff), f)
+    os.replace(tmp_path, cache_path)
+    prune_least_recent(cache_dir, ".json", DIFF_CACHE_SIZE)
+
+
+def prune_least_recent(directory, suffix, keep) -> None:
+    """Removes all but the keep most recently modified files ending with suffix"""
+
+    def mtime(entry):
+        try:
+            return entry.stat().st_mtime
+        except FileNotFoundError:
+            return 0.0
+
+    entries = sorted(
+        (entry for entry in os.scandir(directory) if entry.name.endswith(suffix)),
+        key=mtime,
+    )
+    for entry in entries[:-keep]:
+        try:
+            os.remove(entry.path)
+        except FileNotFoundError:
             pass
-        # left_only merge will show the data present in base config, but missing in running config.
-        # Ex: some configurations was removed from CUCM, but not updated in base config.
-        baseconfig = df1.merge(df2.reset_index(drop=True), indicator=True, how="left")
-        base_config = (baseconfig[baseconfig["_merge"] == "left_only"]).drop(
-            columns="_merge"
+
+
+def prune_reports(config_relative_path) -> None:
+    report_dir = os.path.join(config_relative_path, REPORT_DIR)
+    if os.path.isdir(report_dir):
+        prune_least_recent(report_dir, ".gz", REPORT_KEEP)
+
+
+def get_config_diff(config_relative_path, config_item) -> ConfigDiff:
+    """Returns the diff of a config item, reusing the cached one if neither side changed"""
+    return compare_all_with_base(config_relative_path, [config_item], workers=1)[
+        config_item
+    ]
+
+
+@functools.cache
+def get_diff_pool(workers=None) -> ProcessPoolExecutor:
+    """Process pool of the diffs, kept for the life of the process and shared by clusters.
+
+    The status server and cluster threads may already run, so the workers are started
+    by a fork server instead of forking a process that may hold their locks.
+    """
+    return ProcessPoolExecutor(
+        max_workers=workers, mp_context=multiprocessing.get_context("forkserver")
+    )
+
+
+def compare_all_with_base(config_relative_path, config_items, workers=None) -> dict:
+    """Diffs many config items, spreading the changed ones over a process pool.
+
+    Items whose base and running snapshots hash the same are skipped and diffs already
+    computed for the same pair of snapshots are served from the diff cache. Workers only
+    receive the snapshot location and the item name, and the results are returned in the
+    order of config_items regardless of which worker finished first.
+    """
+    # Hashes and diffs all come from one generation even if a refresh publishes another.
+    with snapshot_view(config_relative_path) as generation, PROFILER.span("diff"):
+        return compare_generation(
+            config_relative_path, config_items, workers, generation
+        )
+
+
+def compare_generation(config_relative_path, config_items, workers, generation) -> dict:
+    diffs = {}
+    misses = {}
+    hashes = {}
+    for item in config_items:
+        base_hash = snapshot_digest("baseconfig", config_relative_path, item)
+        running_hash = snapshot_digest("runningconfig", config_relative_path, item)
+        hashes[item] = {"base": base_hash, "running": running_hash}
+        if base_hash == running_hash:
+            diffs[item] = ConfigDiff(config_item=item)
+            continue
+        cache_path = get_diff_cache_path(
+            config_relative_path, item, base_hash, running_hash
         )
-        # right_only merge will show the data present in running_config, but missing in base config.
-        # Ex: some configurations was added in CUCM, but not updated in base config.
-        runningconfig = df1.merge(df2, indicator=True, how="right")
-        running_config = (runningconfig[runningconfig["_merge"] == "right_only"]).drop(
-            columns="_merge"
+        cached = load_cached_diff(cache_path)
+        if cached is None:
+            misses[item] = cache_path
+        else:
+            diffs[item] = cached
+    changed = list(misses)
+    if len(changed) > 1 and workers != 1:
+        results = get_diff_pool(workers).map(
+            diff_running_with_base,
+            repeat(config_relative_path),
+            changed,
+            repeat(generation),
         )
+        computed = dict(zip(changed, results))
+    else:
+        computed = {
+            item: diff_running_with_base(config_relative_path, item, generation)
+            for item in changed
+        }
+    # Only the parent process writes to the cache, so workers never race on entries.
+    for item, diff in computed.items():
+        store_cached_diff(misses[item], diff)
+    if any(diff.full_diff_path for diff in computed.values()):
+        prune_reports(config_relative_path)
+    diffs.update(computed)
+    # Snapshots can differ in bytes only, ex: line endings, the diff decides.
+    for item, entry in hashes.items():
+        entry["changed"] = bool(diffs[item].html)
+    record_manifest(config_relative_path, hashes)
+    return {item: diffs[item] for item in config_items}
+
+
+def load_manifest(config_relative_path) -> dict:
+    try:
+        with open(os.path.join(config_relative_path, MANIFEST_FILE)) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {"generation": 0, "items": {}}
 
-        # Shape gives tuple of (num_of_rows, num_of_cols).
-        # columns will always remains same, it is the predefined parameters that we are pulling from CUCM. check only rows to identify the change was
-        # happened in baseconfig or running config.
-        if (((base_config.values).shape[0]) != 0) & (
-            ((running_config.values).shape[0]) == 0
-        ):
-            # Base config value is non zero, it means after removing the common items from baseconfig and runningconfig, baseconfig still has some rows,
-            # so something was removed in the CUCM, but not updated in the base config.
-            base_config_html = base_config.to_html()
-            body = f"<br />Changes detected in '{config_item}'. <br /> Below configs have been removed: <br />"
-            print(
-                body.replace("<br />", "\n"),
-                tabulate(
-                    base_config, headers=base_config.columns, tablefmt="fancy_grid"
-                ),
+
+def record_manifest(
+    config_relative_path, hashes, generation=None, fingerprints=None
+) -> None:
+    """Merges the snapshot hashes and template fingerprints of the given items into the manifest"""
+    with MANIFEST_LOCK:
+        manifest = load_manifest(config_relative_path)
+        manifest["items"].update(hashes)
+        manifest.setdefault("fingerprints", {}).update(fingerprints or {})
+        if generation is not None:
+            manifest["generation"] = generation
+        with SnapshotWriter() as writer:
+            writer.write(
+                os.path.join(config_relative_path, MANIFEST_FILE),
+                json.dumps(manifest, indent=2, sort_keys=True).encode(),
             )
-            htmldiff += body + base_config_html
-        elif (((running_config.values).shape[0]) != 0) & (
-            ((base_config.values).shape[0]) == 0
+
+
+def fingerprint_sql(sql) -> str:
+    """Aggregate query over the tables of a template, cheap for CUCM to answer.
+
+    Row count and pkid range of each table the template reads, the type lookup tables
+    are static and left out.
+    """
+    tables = dict.fromkeys(
+        table.lower()
+        for table in sql_tables(sql)
+        if not table.lower().startswith("type")
+    )
+    return " union all ".join(
+        f"select '{table}' as tablename, count(*) as row_count, min(pkid) as min_pkid, max(pkid) as max_pkid from {table}"
+        for table in tables
+    )
+
+
+def fetch_template(
+    service, history, config_relative_path, config_item, full=True, status=STATUS
+) -> tuple:
+    """Pulls a template unless full is off and its fingerprint matches the last pull.
+
+    Returns the AXL response, None when the pull was skipped, and the fingerprint to
+    record once the response is saved. The fingerprint only sees rows being added or
+    removed, so full pulls don't query it and a fingerprint older than
+    FINGERPRINT_MAX_AGE is not trusted.
+    """
+    sql = templates[config_item]
+    if full:
+        with PROFILER.span(f"sql:{config_item}"):
+            return execute_sql_query(service, history, sql, status), None
+    try:
+        with PROFILER.span(f"fingerprint:{config_item}"):
+            resp = execute_sql_query(service, history, fingerprint_sql(sql), status)
+        rows = resp["return"]["row"] if resp and resp["return"] else []
+        fingerprint = {
+            "value": sorted([column.text for column in row] for row in rows),
+            "taken": time.time(),
+        }
+    except Fault:
+        fingerprint = None
+    if fingerprint is not None:
+        stored = load_manifest(config_relative_path).get("fingerprints", {})
+        last = stored.get(config_item)
+        if (
+            last is not None
+            and last["value"] == fingerprint["value"]
+            and fingerprint["taken"] - last["taken"] < FINGERPRINT_MAX_AGE
         ):
-            # similar to the above condition, after merging runningconfig still has some extra rows, it means some config was added in CUCM, but not updated in
-            # base config.
-            running_config_html = running_config.to_html()
-            body = "<br />Changes detected in '{csvname}'. <br /> Below configs have been added: <br />".format(
-                csvname=config_item
-            )
-            print(
-                body.replace("<br />", "\n"),
-                tabulate(
-                    running_config,
-                    headers=running_config.columns,
-                    tablefmt="fancy_grid",
-                ),
-            )
-            htmldiff += body + running_config_html
-        else:
-            # This final else statement covers both the scenario of some configs were added/removed and also the existing data was modified.
-            index = base_config.columns[0]
-            base_config_columns = base_config.columns
-            running_config_columns = running_config.columns
-            if changed_index:
-                if index not in changed_index[0]:
-                    base_config_columns = changed_index[0].copy()
-                    running_config_columns = changed_index[0].copy()
-                    base_config_columns.insert(0, base_config.columns[0])
-                    running_config_columns.insert(0, running_config.columns[0])
-            base_config_html = (base_config[base_config_columns]).to_html()
-            body = (
-                f"<br />Base configs and running configs has been modified for '{config_item}'. "
-                "<br />Configs in Base Repo: <br />"
-            )
-            print(
-                body.replace("<br />", "\n"),
-                tabulate(
-                    base_config[base_config_columns],
-                    headers=base_config[base_config_columns],
-                    tablefmt="fancy_grid",
-                ),
-                sep="",
-            )
-            htmldiff += body + base_config_html
-            running_config_html = (running_config[running_config_columns]).to_html()
-            body = "<br />Configs in Running Config: <br />"
-            print(
-                body.replace("<br />", "\n"),
-                tabulate(
-                    running_config[running_config_columns],
-                    headers=running_config[running_config_columns],
-                    tablefmt="fancy_grid",
-                ),
-                sep="",
-            )
-            htmldiff += body + running_config_html
-    return htmldiff
+            logging.info(f"Fingerprint of {config_item} unchanged, skipping the pull")
+            return None, None
+    with PROFILER.span(f"sql:{config_item}"):
+        return execute_sql_query(service, history, sql, status), fingerprint
 
 
-def update_runningconfig(
-    cucmpub, config_relative_path, config_item, resp, email_recipient
-) -> str:
+def changed_items_from_manifest(config_relative_path) -> list:
+    """Items whose base and running snapshots differed when they were last diffed"""
+    items = load_manifest(config_relative_path)["items"]
+    return sorted(item for item, entry in items.items() if entry.get("changed"))
+
+
+def read_header(config_relative_path, config_item) -> list:
+    """Columns of the snapshots of a config item, those of its base config.
+
+    Columns appended to the template since the base config was committed are added,
+    the item shows as changed until it is committed again.
+    """
     with open(
         get_config_relative_path("baseconfig", config_relative_path, config_item)
     ) as csvfile:
         csv_reader = reader(csvfile)
         header = next(csv_reader)
+    try:
+        with open(os.path.join(TEMPLATE_DIR, config_item + ".csv")) as csvfile:
+            template_header = next(reader(csvfile))
+    except (FileNotFoundError, StopIteration):
+        return header
+    if template_header[: len(header)] == header:
+        return template_header
+    return header
+
+
+def row_values(row, column_count) -> list:
+    data = []
+    for j in range(0, column_count):
+        # check if the root element has children, and append the children details.
+        if len(row[j]):
+            child_values = []
+            for child in row[j]:
+                child_values.append(f"{child.tag} - {child.text}")  # pyright: ignore[reportAttributeAccessIssue]
+            data.append(child_values)
+        data.append(row[j].text)  # pyright: ignore[reportAttributeAccessIssue]
+    return data
+
+
+def canonical_xml(value) -> bytes | None:
+    """C14N form of an XML document without ignorable whitespace, None if not XML"""
+    if not isinstance(value, str) or not value.lstrip().startswith("<"):
+        return None
+    try:
+        root = etree.fromstring(
+            value.encode(),
+            etree.XMLParser(remove_blank_text=True, resolve_entities=False),
+        )
+    except etree.XMLSyntaxError:
+        return None
+    return etree.tostring(root, method="c14n")
+
+
+def get_blob_path(config_relative_path, digest) -> str:
+    return os.path.join(config_relative_path, BLOB_DIR, digest + ".xml")
+
+
+def store_blob(config_relative_path, value, writer=None) -> str:
+    """Moves an XML cell out of line, returning the reference kept in the snapshot.
+
+    Documents differing only in whitespace or attribute order get the same reference.
+    Values that aren't XML, or are references already, are returned as they are.
+    """
+    canonical = canonical_xml(value)
+    if canonical is None:
+        return value
+    digest = hashlib.sha256(canonical).hexdigest()
+    path = get_blob_path(config_relative_path, digest)
+    if not os.path.exists(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        if writer is None:
+            with SnapshotWriter() as own_writer:
+                own_writer.write(path, canonical)
+        else:
+            writer.write(path, canonical)
+    return BLOB_PREFIX + digest
+
+
+def blob_reference(value) -> str:
+    """Reference store_blob would return for a cell, without storing anything"""
+    canonical = canonical_xml(value)
+    if canonical is None:
+        return value
+    return BLOB_PREFIX + hashlib.sha256(canonical).hexdigest()
+
+
+def load_blob(config_relative_path, reference, documents=None) -> str:
+    """XML document of a reference, from documents first, else from BLOB_DIR.
+
+    A reference whose blob is missing is returned as it is, the report then shows the
+    hash instead of the elements.
+    """
+    if not reference.startswith(BLOB_PREFIX):
+        return reference
+    if documents and reference in documents:
+        return documents[reference]
+    try:
+        with open(
+            get_blob_path(config_relative_path, reference.removeprefix(BLOB_PREFIX))
+        ) as f:
+            return f.read()
+    except FileNotFoundError:
+        logging.warning(f"Blob {reference} is missing from {BLOB_DIR}")
+        return reference
+
+
+def xml_elements(document) -> dict:
+    """Flattens an XML document into {path: text}, attributes as path/@name"""
+    elements = {}
+    if not document:
+        return elements
+
+    def walk(element, path):
+        elements[path] = (element.text or "").strip()
+        for name, value in sorted(element.attrib.items()):
+            elements[f"{path}/@{name}"] = value
+        seen = Counter()
+        for child in element:
+            if not isinstance(child.tag, str):
+                continue
+            seen[child.tag] += 1
+            walk(child, f"{path}/{child.tag}[{seen[child.tag]}]")
+
+    try:
+        root = etree.fromstring(document.encode())
+    except etree.XMLSyntaxError:
+        return {"/": document}
+    walk(root, f"/{root.tag}")
+    return elements
+
+
+def xml_changes(base_document, running_document) -> list:
+    """[path, base value, running value] of the elements that differ"""
+    base = xml_elements(base_document)
+    running = xml_elements(running_document)
+    return [
+        [path, base.get(path, ""), running.get(path, "")]
+        for path in sorted(base.keys() | running.keys())
+        if base.get(path) != running.get(path)
+    ]
+
+
+@profile_span("render")
+def render_xml_changes(
+    out, config_relative_path, config_item, base_rows, running_rows, documents=None
+):
+    """Prints and returns the html of the element level changes of the blob columns.
+
+    base_rows and running_rows are the rows only in the base or only in the running
+    config. They are paired up on all their other columns, ex: the name and type of a
+    service profile detail, rows repeating the same values in order of appearance.
+    All the pairs share REPORT_MAX_ROWS element rows, also returns how many of the
+    changed elements didn't fit.
+    """
+    columns = [
+        column for column in blob_columns.get(config_item, ()) if column in base_rows
+    ]
+    if not columns:
+        return "", 0
+    keys = [column for column in base_rows.columns if column not in columns]
+    pairs = base_rows.assign(_occurrence=base_rows.groupby(keys).cumcount()).merge(
+        running_rows.assign(_occurrence=running_rows.groupby(keys).cumcount()),
+        on=[*keys, "_occurrence"],
+        suffixes=("_base", "_running"),
+    )
+    # Rows are named by their first column, plus the columns telling apart the rows
+    # sharing it.
+    label_keys = keys[:1] + [
+        key for key in keys[1:] if pairs.groupby(keys[0])[key].nunique().max() > 1
+    ]
+    htmldiff = ""
+    budget = REPORT_MAX_ROWS
+    hidden = 0
+    for _, pair in pairs.iterrows():
+        label = ", ".join(str(pair[key]) for key in label_keys)
+        for column in columns:
+            base_value = pair[f"{column}_base"]
+            running_value = pair[f"{column}_running"]
+            if base_value == running_value:
+                continue
+            changes = xml_changes(
+                load_blob(config_relative_path, base_value, documents),
+                load_blob(config_relative_path, running_value, documents),
+            )
+            shown = changes[:budget]
+            budget -= len(shown)
+            hidden += len(changes) - len(shown)
+            if not shown:
+                continue
+            htmldiff += render_rows(
+                out,
+                f"<br />XML elements of {column} changed for '{label}' in '{config_item}': <br />",
+                shown,
+                ["element", "baseconfig", "running_config"],
+                len(changes),
+            )
+    if hidden:
+        print(f"\n{hidden} more XML element changes are in the full diff", file=out)
+        htmldiff += (
+            f"<br />{hidden} more XML element changes are in the full diff <br />"
+        )
+    return htmldiff, hidden
+
+
+def save_runningconfig(config_relative_path, config_item, resp, writer=None) -> bool:
+    """Serialises the AXL response of a config item into its running config snapshot.
+
+    Returns whether the snapshot changed. Without a writer the snapshot is written and
+    synced on its own, otherwise the caller flushes the writer once per cycle.
+    """
+    header = read_header(config_relative_path, config_item)
     filepath = get_config_relative_path(
         "runningconfig", config_relative_path, config_item
     )
-    if os.path.exists(filepath):
-        os.remove(filepath)
-    with open(filepath, "a+") as file:
+    with PROFILER.span(f"serialize:{config_item}"), io.StringIO() as file:
         fieldnames = header
-        writer = csv.writer(file)
-        writer.writerow(fieldnames)
+        csv_writer = csv.writer(file)
+        csv_writer.writerow(fieldnames)
         rowXml = ""
         try:
             rowXml = resp["return"]["row"]
         except Exception as e:
             print("Unable to retrieve anything for " + config_item + str(e))
             pass
+        blob_indexes = [
+            header.index(column)
+            for column in blob_columns.get(config_item, ())
+            if column in header
+        ]
         for i in range(0, len(rowXml)):
-            data = []
-            for j in range(0, len(header)):
-                # check if the root element has children, and append the children details.
-                if len(rowXml[i][j]):
-                    child_values = []
-                    for child in rowXml[i][j]:
-                        child_values.append(f"{child.tag} - {child.text}")  # pyright: ignore[reportAttributeAccessIssue]
-                    data.append(child_values)
-                data.append(rowXml[i][j].text)  # pyright: ignore[reportAttributeAccessIssue]
-            writer.writerow(data)
-    result = compare_running_with_base(config_relative_path, config_item)
+            values = row_values(rowXml[i], len(header))
+            for j in blob_indexes:
+                values[j] = store_blob(config_relative_path, values[j], writer)
+            csv_writer.writerow(values)
+        content = file.getvalue().encode()
+    if writer is None:
+        with SnapshotWriter() as own_writer:
+            return own_writer.write(filepath, content)
+    return writer.write(filepath, content)
+
+
+def fetch_streaming_item(
+    service, history, config_relative_path, config_item, writer, status=STATUS
+):
+    """Pulls a streaming config item chunk by chunk straight into its running snapshot"""
+    spec = streaming_templates[config_item]
+    header = read_header(config_relative_path, config_item)
+    filepath = get_config_relative_path(
+        "runningconfig", config_relative_path, config_item
+    )
+    deadline = time.monotonic() + spec.time_budget
+    pinned = getattr(service, "pinned", contextlib.nullcontext)
+
+    def chunks():
+        # Keyset pages of one pull must come from the same replica.
+        with pinned():
+            yield from pages()
+
+    def pages():
+        with io.StringIO() as file:
+            csv.writer(file).writerow(header)
+            yield file.getvalue().encode()
+        chunk_rows = spec.chunk_rows
+        after = ""
+        while True:
+            if time.monotonic() > deadline:
+                raise BudgetExceededError(
+                    f"Pulling {config_item} took longer than {spec.time_budget}s"
+                )
+            with PROFILER.span(f"sql:{config_item}"):
+                resp = execute_sql_query(
+                    service,
+                    history,
+                    spec.sql.format(first=chunk_rows, after=after),
+                    status,
+                )
+            try:
+                rows = resp["return"]["row"]
+            except (KeyError, TypeError):
+                rows = []
+            # The chunk is serialised and handed over in pieces, the budget is checked
+            # as it grows instead of once it is complete.
+            size = 0
+            remaining = iter(rows)
+            while True:
+                with PROFILER.span(f"serialize:{config_item}"), io.StringIO() as file:
+                    csv_writer = csv.writer(file)
+                    for row in remaining:
+                        csv_writer.writerow(row_values(row, len(header)))
+                        if file.tell() >= STREAMING_PIECE_SIZE:
+                            break
+                    piece = file.getvalue().encode()
+                if not piece:
+                    break
+                size += len(piece)
+                if size > spec.memory_budget and chunk_rows <= STREAMING_MIN_CHUNK_ROWS:
+                    raise BudgetExceededError(
+                        f"A chunk of {chunk_rows} rows of {config_item} is larger than {spec.memory_budget} bytes"
+                    )
+                yield piece
+            if len(rows) < chunk_rows:
+                return
+            after = rows[-1][0].text  # pyright: ignore[reportAttributeAccessIssue]
+            # Size the next chunk to fit the budget at the row size seen so far.
+            rows_in_budget = int(spec.memory_budget * len(rows) / max(size, 1))
+            if rows_in_budget < chunk_rows:
+                chunk_rows = max(rows_in_budget, STREAMING_MIN_CHUNK_ROWS)
+
+    return writer.write_stream(filepath, chunks())
+
+
+def refresh_streaming_items(
+    service, history, config_relative_path, config_items, writer, status=STATUS
+) -> list:
+    """Refreshes the streaming config items, skipping those that exceed their budget"""
+    refreshed = []
+    for item in config_items:
+        try:
+            fetch_streaming_item(
+                service, history, config_relative_path, item, writer, status
+            )
+        except BudgetExceededError as err:
+            print(f"{err}, keeping the previous running config")
+            continue
+        refreshed.append(item)
+    return refreshed
+
+
+def streaming_change_types() -> list:
+    return sorted(
+        {
+            change
+            for spec in streaming_templates.values()
+            for change in spec.change_types
+        }
+    )
+
+
+def streaming_items_for_changes(change_types) -> list:
+    return [
+        item
+        for item, spec in streaming_templates.items()
+        if set(spec.change_types) & set(change_types)
+    ]
+
+
+def affected_config_items(change_types) -> list:
+    """Config items to refresh for a set of listChange types.
+
+    That's the changed items themselves plus the items that join one of their tables.
+    Items further downstream only show names of the directly affected items, which
+    didn't change, so the refresh set is not expanded transitively.
+    """
+    changed = {item for item in change_types if item in templates}
+    changed.update(streaming_items_for_changes(change_types))
+    affected = changed | {
+        item
+        for item, upstream in config_dependencies.items()
+        if upstream & set(change_types)
+    }
+    return [item for item in [*templates, *streaming_templates] if item in affected]
+
+
+@profile_span("render")
+def render_rows(out, body, rows, columns, total) -> str:
+    """Prints and returns the html of a bounded section of a diff report"""
+    if total > len(rows):
+        body += f"(showing the first {len(rows)} of {total} rows) <br />"
+    frame = pd.DataFrame(rows, columns=columns)
+    print(
+        body.replace("<br />", "\n"),
+        tabulate(frame, headers=frame.columns, tablefmt="fancy_grid"),
+        file=out,
+    )
+    return body + frame.to_html()
+
+
+@profile_span("render")
+def render_column_summary(out, config_item, changes_per_column) -> str:
+    """Prints and returns the html of the number of modified rows per column"""
+    frame = pd.DataFrame(
+        sorted(changes_per_column.items()), columns=["column", "rows_modified"]
+    )
+    body = f"<br />Modified rows per column of '{config_item}': <br />"
+    print(
+        body.replace("<br />", "\n"),
+        tabulate(frame, headers=frame.columns, tablefmt="fancy_grid", showindex=False),
+        file=out,
+    )
+    return body + frame.to_html(index=False)
+
+
+@profile_span("render")
+def render_full_diff_link(out, full_diff_path) -> str:
+    if not full_diff_path:
+        return ""
+    print(f"\nThe full diff is saved in {full_diff_path}\n", file=out)
+    return f"<br />The full diff is saved in <a href='file://{full_diff_path}'>{full_diff_path}</a> <br />"
+
+
+def diff_streaming_item(config_relative_path, config_item) -> ConfigDiff:
+    """Merge-joins the pkid ordered base and running snapshots of a streaming item.
+
+    Only counts and the first max_report_rows rows of each section are kept in memory,
+    however large the snapshots are.
+    """
+    cap = streaming_templates[config_item].max_report_rows
+    removed, added, base_modified, running_modified = [], [], [], []
+    removed_count = added_count = modified_count = 0
+    changed_columns = Counter()
+    with (
+        open(
+            get_config_relative_path("baseconfig", config_relative_path, config_item),
+            newline="",
+        ) as base_file,
+        open(
+            get_config_relative_path(
+                "runningconfig", config_relative_path, config_item
+            ),
+            newline="",
+        ) as running_file,
+    ):
+        base_reader = reader(base_file)
+        running_reader = reader(running_file)
+        header = next(base_reader, None)
+        header = next(running_reader, None) or header or []
+        full_diff = FullDiffWriter(config_relative_path, config_item, header)
+        base_row = next(base_reader, None)
+        running_row = next(running_reader, None)
+        while base_row is not None or running_row is not None:
+            if running_row is None or (
+                base_row is not None and base_row[0] < running_row[0]
+            ):
+                removed_count += 1
+                full_diff.row("removed", base_row)
+                if len(removed) < cap:
+                    removed.append(base_row)
+                base_row = next(base_reader, None)
+            elif base_row is None or running_row[0] < base_row[0]:
+                added_count += 1
+                full_diff.row("added", running_row)
+                if len(added) < cap:
+                    added.append(running_row)
+                running_row = next(running_reader, None)
+            else:
+                if base_row != running_row:
+                    modified_count += 1
+                    full_diff.row("modified_base", base_row)
+                    full_diff.row("modified_running", running_row)
+                    changed_columns.update(
+                        i
+                        for i, (a, b) in enumerate(zip(base_row, running_row))
+                        if a != b
+                    )
+                    if len(base_modified) < cap:
+                        base_modified.append(base_row)
+                        running_modified.append(running_row)
+                base_row = next(base_reader, None)
+                running_row = next(running_reader, None)
+        if max(removed_count, added_count, modified_count) > cap:
+            full_diff.keep()
+        full_diff_path = full_diff.close()
+
+    htmldiff = ""
+    out = io.StringIO()
+    modified_columns = [header[i] for i in sorted(changed_columns)] if header else []
+    if modified_count:
+        htmldiff += f" <br />Following parameters have been modified in {config_item}: {[modified_columns]} <br />"
+        print(
+            f"\n\nFollowing parameters have been modified in the {config_item}: {[modified_columns]} \n",
+            file=out,
+        )
+        htmldiff += render_column_summary(
+            out,
+            config_item,
+            {header[i]: count for i, count in changed_columns.items()},
+        )
+        # Keep the pkid and the identifying second column next to the changed ones.
+        shown = sorted({0, 1, *changed_columns} & set(range(len(header))))
+        columns = [header[i] for i in shown]
+        htmldiff += render_rows(
+            out,
+            f"<br />Base configs and running configs has been modified for '{config_item}'. "
+            "<br />Configs in Base Repo: <br />",
+            [[row[i] for i in shown] for row in base_modified],
+            columns,
+            modified_count,
+        )
+        htmldiff += render_rows(
+            out,
+            "<br />Configs in Running Config: <br />",
+            [[row[i] for i in shown] for row in running_modified],
+            columns,
+            modified_count,
+        )
+    if removed_count:
+        htmldiff += render_rows(
+            out,
+            f"<br />Changes detected in '{config_item}'. <br /> Below configs have been removed: <br />",
+            removed,
+            header,
+            removed_count,
+        )
+    if added_count:
+        htmldiff += render_rows(
+            out,
+            f"<br />Changes detected in '{config_item}'. <br /> Below configs have been added: <br />",
+            added,
+            header,
+            added_count,
+        )
+    htmldiff += render_full_diff_link(out, full_diff_path)
+    return ConfigDiff(
+        config_item=config_item,
+        modified_columns=modified_columns,
+        removed_rows=removed_count,
+        added_rows=added_count,
+        html=htmldiff,
+        text=out.getvalue(),
+        full_diff_path=full_diff_path,
+    )
+
+
+def notify_running_change(
+    cucmpub, config_item, result, email_recipient, status=STATUS
+) -> None:
     if result:
         date = datetime.now().strftime("%Y_%m_%d")
         subject = f"{date} : Changes made in the call manager has been commited to running-config. Please update base-config"
@@ -293,44 +2521,272 @@ def update_runningconfig(
             email_recipient=email_recipient,
             subject=subject,
             body=body,
+            status=status,
         )
     else:
         pass
 
-    return result
+
+def update_runningconfig(
+    cucmpub,
+    config_relative_path,
+    config_item,
+    resp,
+    email_recipient,
+    writer=None,
+    status=STATUS,
+) -> str:
+    save_runningconfig(config_relative_path, config_item, resp, writer)
+    return report_running_change(
+        cucmpub, config_relative_path, config_item, email_recipient, status
+    )
+
+
+def report_running_change(
+    cucmpub, config_relative_path, config_item, email_recipient, status=STATUS
+) -> str:
+    diff = get_config_diff(config_relative_path, config_item)
+    print(diff.text, end="")
+    status.record_refresh(config_item, diff)
+    notify_running_change(cucmpub, config_item, diff.html, email_recipient, status)
+    return diff.html
+
+
+@functools.cache
+def load_wsdl(wsdl_path) -> Document:
+    """Parses the AXL WSDL once per process, all clusters and services share it"""
+    return Document(
+        wsdl_path, Transport(cache=SqliteCache(), timeout=20), settings=AXL_SETTINGS
+    )
 
 
-def create_service(*, cucmpub, username, password, certroot, wsdl_path) -> tuple:
+def create_service(
+    *, cucmpub, username, password, certroot, wsdl_path, history=None
+) -> tuple:
     wsdl = wsdl_path
     hostname = cucmpub
     host = socket.getfqdn(hostname)
     location = f"https://{host}:8443/axl/"
     binding = "{http://www.cisco.com/AXLAPIService/}AXLAPIBinding"
-    history = HistoryPlugin()
+    # Nodes of one cluster share the history, so credential errors are caught the same.
+    history = history or HistoryPlugin()
     auth_header = password
     session = Session()
     session.verify = certroot
     session.auth = HTTPBasicAuth(username, auth_header)
-    settings = Settings(strict=False, xml_huge_tree=True)  # pyright: ignore[reportCallIssue]
-    transport = Transport(cache=SqliteCache(), session=session, timeout=20)
+    if TRAFFIC is None:
+        transport = Transport(cache=SqliteCache(), session=session, timeout=20)
+    else:
+        transport = ArchiveTransport(
+            TRAFFIC, cache=SqliteCache(), session=session, timeout=20
+        )
     plugins = [RequestResponseLoggingPlugin()] if DEBUG else [history]
-    client = Client(wsdl=wsdl, settings=settings, transport=transport, plugins=plugins)
+    client = Client(
+        wsdl=load_wsdl(wsdl),
+        settings=AXL_SETTINGS,
+        transport=transport,
+        plugins=plugins,
+    )
     return client.create_service(binding, location), history
 
 
+class AxlReadPool:
+    """Spreads the read-only SQL of a cluster over its AXL enabled nodes.
+
+    executeSQLQuery goes round robin over the healthy subscribers and falls back to the
+    publisher when none is left. A node that fails at the transport level is taken out
+    for AXL_NODE_RETRY seconds and only comes back once a probe query succeeds. SQL
+    faults are raised as is, they'd fail on any node. Everything else, listChange in
+    particular, goes to the publisher.
+    """
+
+    def __init__(self, publisher, nodes):
+        self.publisher = publisher
+        self.nodes = nodes
+        self.down_until = dict.fromkeys(nodes, 0.0)
+        self.lock = threading.Lock()
+        self.turn = 0
+        self.pinned_node = threading.local()
+
+    def __getattr__(self, name):
+        return getattr(self.publisher, name)
+
+    def nodes_to_probe(self) -> list:
+        """Down nodes whose retry time has come, claimed by the calling thread"""
+        now = time.monotonic()
+        due = [node for node, until in self.down_until.items() if 0.0 < until <= now]
+        # Other threads keep treating them as down while they are probed.
+        for node in due:
+            self.down_until[node] = now + AXL_NODE_RETRY
+        return due
+
+    def probe(self, node) -> None:
+        try:
+            self.nodes[node].executeSQLQuery(AXL_PROBE_SQL)
+        except (RequestException, TransportError, Fault):
+            with self.lock:
+                self.mark_down(node)
+            return
+        with self.lock:
+            self.down_until[node] = 0.0
+
+    def mark_down(self, node) -> None:
+        logging.warning(f"AXL node {node} is unavailable, retrying it later")
+        self.down_until[node] = time.monotonic() + AXL_NODE_RETRY
+
+    def next_node(self) -> str | None:
+        with self.lock:
+            due = self.nodes_to_probe()
+        # Probes go over the network, the other threads mustn't wait on them.
+        for node in due:
+            self.probe(node)
+        with self.lock:
+            healthy = [node for node, until in self.down_until.items() if not until]
+            if not healthy:
+                return None
+            self.turn += 1
+            return healthy[self.turn % len(healthy)]
+
+    def executeSQLQuery(self, sql) -> Any:
+        node = getattr(self.pinned_node, "node", None) or self.next_node()
+        while node is not None:
+            try:
+                return self.nodes[node].executeSQLQuery(sql)
+            except (RequestException, TransportError):
+                with self.lock:
+                    self.mark_down(node)
+                node = self.next_node()
+                if getattr(self.pinned_node, "node", None):
+                    self.pinned_node.node = node
+        return self.publisher.executeSQLQuery(sql)
+
+    @contextlib.contextmanager
+    def pinned(self):
+        """Sends the queries of the block to a single node, ex: the chunks of one pull"""
+        self.pinned_node.node = self.next_node()
+        try:
+            yield
+        finally:
+            self.pinned_node.node = None
+
+
+def discover_axl_nodes(publisher, history) -> list:
+    """Names of the subscribers with the AXL Web Service activated"""
+    resp = execute_sql_query(publisher, history, axl_nodes_sql)
+    try:
+        rows = resp["return"]["row"]
+    except (KeyError, TypeError):
+        rows = []
+    return [row[0].text for row in rows]
+
+
+def create_cluster_service(cluster, certroot) -> tuple:
+    """AXL service of a cluster, reading through its subscribers when configured.
+
+    The "axl_read_nodes" key of the cluster config lists the nodes to read from, or is
+    "discover" to read from every node running the AXL Web Service. Without it all
+    requests go to the publisher.
+    """
+    history = HistoryPlugin()
+    publisher, history = create_service(
+        cucmpub=cluster["cucmpub"],
+        username=cluster["cucm_axl_username"],
+        password=cluster["cucm_axl_password"],
+        certroot=certroot,
+        wsdl_path=cluster["cucm_axl_api_wsdl_path"],
+        history=history,
+    )
+    read_nodes = cluster.get("axl_read_nodes")
+    if not read_nodes:
+        return publisher, history
+    if read_nodes == "discover":
+        read_nodes = discover_axl_nodes(publisher, history)
+    nodes = {
+        node: create_service(
+            cucmpub=node,
+            username=cluster["cucm_axl_username"],
+            password=cluster["cucm_axl_password"],
+            certroot=certroot,
+            wsdl_path=cluster["cucm_axl_api_wsdl_path"],
+            history=history,
+        )[0]
+        for node in read_nodes
+    }
+    return AxlReadPool(publisher, nodes), history
+
+
+@profile_span("ssh")
 def ssh_connect_output(cucmpub, cucm_cli_username, cucm_cli_password, cmd) -> str:
     hostname = cucmpub
     username = cucm_cli_username
-    with SSHClient() as ssh:
-        ssh.set_missing_host_key_policy(paramiko.AutoAddPolicy())
-        auth_header = cucm_cli_password
-        ssh.connect(hostname=hostname, username=username, password=auth_header)
-        interact = SSHClientInteraction(ssh, display=False)
-        interact.expect("admin:")
-        interact.send(cmd)
-        interact.expect("admin:")
-        output = interact.current_output_clean
-        return output
+
+    def run():
+        with SSHClient() as ssh:
+            ssh.set_missing_host_key_policy(paramiko.AutoAddPolicy())
+            auth_header = cucm_cli_password
+            ssh.connect(hostname=hostname, username=username, password=auth_header)
+            interact = SSHClientInteraction(ssh, display=False)
+            interact.expect("admin:")
+            interact.send(cmd)
+            interact.expect("admin:")
+            output = interact.current_output_clean
+            return output
+
+    if TRAFFIC is not None:
+        return TRAFFIC.ssh(hostname, cmd, run)
+    return run()
+
+
+class SSHSessionPool:
+    """Keeps the admin CLI session to a CUCM node open between commands.
+
+    One per cluster, so the periodic CLI commands don't pay for a new SSH handshake and
+    login every time. A broken session is reconnected once before giving up.
+    """
+
+    def __init__(self, hostname, username, password):
+        self.hostname = hostname
+        self.username = username
+        self.password = password
+        self.lock = threading.Lock()
+        self.ssh = None
+        self.interact = None
+
+    @profile_span("ssh")
+    def run(self, cmd) -> str:
+        if TRAFFIC is not None:
+            return TRAFFIC.ssh(self.hostname, cmd, lambda: self.run_command(cmd))
+        return self.run_command(cmd)
+
+    def run_command(self, cmd) -> str:
+        with self.lock:
+            for attempt in range(2):
+                try:
+                    interact = self.interact or self.connect()
+                    interact.send(cmd)
+                    interact.expect("admin:")
+                    return interact.current_output_clean
+                except (paramiko.SSHException, OSError):
+                    self.close()
+                    if attempt:
+                        raise
+        return ""
+
+    def connect(self) -> SSHClientInteraction:
+        self.ssh = SSHClient()
+        self.ssh.set_missing_host_key_policy(paramiko.AutoAddPolicy())
+        self.ssh.connect(
+            hostname=self.hostname, username=self.username, password=self.password
+        )
+        self.interact = SSHClientInteraction(self.ssh, display=False)
+        self.interact.expect("admin:")
+        return self.interact
+
+    def close(self) -> None:
+        if self.ssh is not None:
+            self.ssh.close()
+        self.ssh = None
+        self.interact = None
 
 
 def get_presence_server_high_availability_and_save_in_csv(
@@ -338,9 +2794,14 @@ def get_presence_server_high_availability_and_save_in_csv(
     cucm_cli_username,
     cucm_cli_password,
     config_relative_path,
+    writer=None,
+    ssh_pool=None,
 ) -> None:
     cmd = "utils ha status"
-    resp = ssh_connect_output(cucmpub, cucm_cli_username, cucm_cli_password, cmd)
+    if ssh_pool is None:
+        resp = ssh_connect_output(cucmpub, cucm_cli_username, cucm_cli_password, cmd)
+    else:
+        resp = ssh_pool.run(cmd)
     data = re.findall(
         r"\tName:\s+(\S+).*?State:\s+(\S+).*?Reason:\s+(\S+)", resp, re.DOTALL
     )
@@ -354,60 +2815,217 @@ def get_presence_server_high_availability_and_save_in_csv(
         config_relative_path,
         "Imp_High_Availability_Status",
     )
-    df.to_csv(export_path, index=False)
+    content = df.to_csv(index=False).encode()
+    if writer is None:
+        with SnapshotWriter() as own_writer:
+            own_writer.write(export_path, content)
+    else:
+        writer.write(export_path, content)
 
 
-def auto_check(
-    cucmpub, config_relative_path, service, history, email_recipient
-) -> None:
-    result = ""
-    for template, sql in templates.items():
-        try:
-            resp = execute_sql_query(service, history, sql)
-        except Fault as err:
-            if does_last_response_report_credential_error(history):
-                raise ServerCredentialError(err)
-            else:
-                raise
-        result += update_runningconfig(
-            cucmpub, config_relative_path, template, resp, email_recipient
-        )
-    if result:
+def refresh_running_configs(
+    service,
+    history,
+    config_relative_path,
+    config_items,
+    full=True,
+    status=STATUS,
+    ssh_pool=None,
+) -> list:
+    """Pulls the running config of the items into their snapshots in one sync.
+
+    Without full, templates with an unchanged fingerprint are skipped. The high
+    availability status is only pulled with an ssh_pool. Returns the items pulled.
+    """
+    refreshed = []
+    fingerprints = {}
+    with SnapshotWriter() as writer:
+        for item in config_items:
+            if item == "Imp_High_Availability_Status":
+                if ssh_pool is not None:
+                    get_presence_server_high_availability_and_save_in_csv(
+                        ssh_pool.hostname,
+                        None,
+                        None,
+                        config_relative_path,
+                        writer,
+                        ssh_pool,
+                    )
+                    refreshed.append(item)
+                continue
+            if item in streaming_templates:
+                refreshed += refresh_streaming_items(
+                    service, history, config_relative_path, [item], writer, status
+                )
+                continue
+            try:
+                resp, fingerprint = fetch_template(
+                    service, history, config_relative_path, item, full, status
+                )
+            except Fault as err:
+                if does_last_response_report_credential_error(history):
+                    raise ServerCredentialError(err)
+                else:
+                    raise
+            if resp is None:
+                continue
+            save_runningconfig(config_relative_path, item, resp, writer)
+            refreshed.append(item)
+            if fingerprint is not None:
+                fingerprints[item] = fingerprint
+    record_manifest(config_relative_path, {}, fingerprints=fingerprints)
+    update_dial_plan_index(config_relative_path, refreshed)
+    return refreshed
+
+
+def check_running_configs(
+    cucmpub,
+    config_relative_path,
+    service,
+    history,
+    config_items,
+    email_recipient,
+    workers=None,
+    status=STATUS,
+    full=True,
+    notify=True,
+    ssh_pool=None,
+) -> dict:
+    """Fetches and diffs the items, records their status and emails the changes.
+
+    Returns the ConfigDiff of each item in the order of config_items.
+    """
+    # Fetching is network bound and stays serial, the CPU bound diff and report
+    # rendering of the refreshed snapshots is spread over the diff worker processes.
+    refresh_running_configs(
+        service, history, config_relative_path, config_items, full, status, ssh_pool
+    )
+    diffs = compare_all_with_base(config_relative_path, config_items, workers)
+    for item, diff in diffs.items():
+        status.record_refresh(item, diff)
+        if notify:
+            notify_running_change(cucmpub, item, diff.html, email_recipient, status)
+    return diffs
+
+
+def print_diffs(diffs) -> None:
+    for diff in diffs.values():
+        print(diff.text, end="")
+    if any(diff.html for diff in diffs.values()):
         print("Base and Running configs has been modified")
     else:
         print("No changes Detected")
 
 
-def update_baseconfig(
-    cucmpub, config_relative_path, config_item, username, commit, email_recipient
-) -> None:
-    source = get_config_relative_path(
-        "runningconfig", config_relative_path, config_item
+def commit_baseconfigs(config_relative_path, contents) -> int:
+    """Replaces the base config of several items in one snapshot generation.
+
+    Either every item is committed or, if the commit fails before its generation is
+    published, none is. Returns the number of the published generation.
+    """
+    with SnapshotWriter() as writer:
+        for item, content in contents.items():
+            writer.write(
+                get_config_relative_path("baseconfig", config_relative_path, item),
+                content,
+            )
+    generation = writer.published.get(
+        config_relative_path, load_manifest(config_relative_path)["generation"]
     )
-    destination = get_config_relative_path(
-        "baseconfig", config_relative_path, config_item
+    # The committed running configs are the new base configs.
+    record_manifest(
+        config_relative_path,
+        {
+            item: dict.fromkeys(
+                ("base", "running"), hashlib.sha256(content).hexdigest()
+            )
+            | {"changed": False}
+            for item, content in contents.items()
+        },
+        generation,
     )
-    diff = compare_running_with_base(config_relative_path, config_item)
-    if diff:
-        body = (
-            f"New configs have been committed successfully from the above running config to the base repo <br /><br />"
-            f"<strong> commit message </strong> {commit} " + diff
-        )
-        subject = f"CUCM Configs: Base config updated by {username}"
-        email(
-            cucmpub=cucmpub,
-            email_recipient=email_recipient,
-            subject=subject,
-            body=body,
-        )
-        copyfile(source, destination)
-        print(
-            "New configs have been committed successfully from the above running config to the base repo. "
-            f"commit message: {commit}"
-        )
+    return generation
+
+
+def update_baseconfig(
+    cucmpub,
+    config_relative_path,
+    config_items,
+    username,
+    commit,
+    email_recipient,
+    status=STATUS,
+) -> int:
+    """Commits the running config of the items to the base config in one generation.
+
+    The diffs come from the manifest and the diff cache of the last check, so nothing is
+    diffed again, and a single email lists every committed item. Items whose running
+    config changed since they were last checked are left out, their diff was never
+    reported. Returns 1 when only such items were left to commit.
+    """
+    manifest = load_manifest(config_relative_path)["items"]
+    contents = {}
+    diffs = []
+    unchecked = []
+    # The running configs committed are the ones of the reported diffs, even if a
+    # refresh publishes a new generation meanwhile.
+    with snapshot_view(config_relative_path):
+        for item in config_items:
+            entry = manifest.get(item)
+            with open(
+                get_config_relative_path("runningconfig", config_relative_path, item),
+                "rb",
+            ) as f:
+                content = f.read()
+            running_hash = hashlib.sha256(content).hexdigest()
+            if entry is None or entry["running"] != running_hash:
+                print(
+                    f"The running config of {item} changed since it was last checked, "
+                    "run check_running or check_all before committing it"
+                )
+                unchecked.append(item)
+                continue
+            if not entry.get("changed"):
+                logging.info(f"No changes were detected in {item}")
+                continue
+            diff = load_cached_diff(
+                get_diff_cache_path(
+                    config_relative_path, item, entry["base"], entry["running"]
+                )
+            ) or get_config_diff(config_relative_path, item)
+            contents[item] = content
+            diffs.append(diff)
+    if not contents:
+        # Nothing to commit is a no-op like before, only unchecked items are an error.
+        print("No changes to commit")
+        return 1 if unchecked else 0
+
+    generation = commit_baseconfigs(config_relative_path, contents)
+    for diff in diffs:
+        print(diff.text, end="")
+    body = (
+        f"New configs have been committed successfully from the above running config to the base repo <br /><br />"
+        f"<strong> commit message </strong> {commit} <br />"
+        f"<strong> committed items </strong> {', '.join(contents)} <br />"
+        + "".join(diff.html for diff in diffs)
+    )
+    subject = f"CUCM Configs: Base config generation {generation} updated by {username}"
+    email(
+        cucmpub=cucmpub,
+        email_recipient=email_recipient,
+        subject=subject,
+        body=body,
+        status=status,
+    )
+    print(
+        f"New configs of {', '.join(contents)} have been committed successfully from the above running config to the base repo "
+        f"as generation {generation}. commit message: {commit}"
+    )
+    return 0
 
 
-def execute_sql_query(service, history, sql) -> Any:
+def execute_sql_query(service, history, sql, status=STATUS) -> Any:
+    status.incr("sql_queries")
     try:
         resp = service.executeSQLQuery(sql)
     except Fault as err:
@@ -418,6 +3036,242 @@ def execute_sql_query(service, history, sql) -> Any:
     return resp
 
 
+class ClusterMonitor:
+    """The list_changes loop of one cluster, split up so several clusters share a process.
+
+    Each monitor owns its listChange cursor, snapshot directory, status, change log and
+    CLI session. cycle() runs one poll and refresh cycle without sleeping and
+    next_wakeup() tells the driver when the next one is due.
+    """
+
+    def __init__(
+        self,
+        name,
+        cucmpub,
+        config_relative_path,
+        cucm_cli_username,
+        cucm_cli_password,
+        service,
+        history,
+        templates,
+        email_recipient,
+        workers=None,
+        print_changes=True,
+        poll_interval=LISTCHANGE_POLL_INTERVAL,
+        cycle_budget=REFRESH_CYCLE_BUDGET,
+        status=STATUS,
+        ssh_pool=None,
+    ):
+        self.name = name
+        self.cucmpub = cucmpub
+        self.config_relative_path = config_relative_path
+        self.service = service
+        self.history = history
+        self.templates = templates
+        self.email_recipient = email_recipient
+        self.workers = workers
+        self.print_changes = print_changes
+        self.poll_interval = poll_interval
+        self.cycle_budget = cycle_budget
+        self.status = status
+        self.ssh_pool = ssh_pool or SSHSessionPool(
+            cucmpub, cucm_cli_username, cucm_cli_password
+        )
+        self.config_items = [
+            *templates,
+            *streaming_templates,
+            "Imp_High_Availability_Status",
+        ]
+        self.sinks = []
+        self.scheduler = RefreshScheduler(self.config_items, time.monotonic())
+        self.writer = None
+        self.queue_id = None
+        self.next_start_change_id = None
+        self.next_poll = 0.0
+
+    def log(self, message) -> None:
+        print(f"[{self.name}] {message}" if self.name else message)
+
+    def start(self) -> bool:
+        """Checks all items and opens the change queue, False if listChange fails"""
+        # Serve the drift status from the snapshots on disk until the first refresh is done.
+        seed_status(self.config_relative_path, self.config_items, self.status)
+        try:
+            print_diffs(
+                check_running_configs(
+                    self.cucmpub,
+                    self.config_relative_path,
+                    self.service,
+                    self.history,
+                    [*self.templates, *streaming_templates],
+                    self.email_recipient,
+                    self.workers,
+                    self.status,
+                )
+            )
+            resp = self.service.listChange()
+        except Fault as err:
+            if does_last_response_report_credential_error(self.history):
+                raise ServerCredentialError(err)
+            self.log(f"Zeep error: polling listChange: {err}")
+            return False
+        self.log("Initial listChange response:")
+        print()
+        print(resp)
+
+        self.queue_id = resp.queueInfo.queueId
+        self.next_start_change_id = resp.queueInfo.nextStartChangeId
+
+        # Events always go to the change log, printing them is an optional extra sink.
+        self.sinks = [ChangeLog(self.config_relative_path)]
+        if self.print_changes:
+            self.sinks.append(ConsoleChangeSink())
+
+        # The high availability status was not part of the first check, pull it right away.
+        self.scheduler.pending["Imp_High_Availability_Status"] = "interval"
+        self.next_poll = time.monotonic()
+        return True
+
+    def refresh(self, item, reason) -> None:
+        if item == "Imp_High_Availability_Status":
+            get_presence_server_high_availability_and_save_in_csv(
+                self.cucmpub,
+                None,
+                None,
+                self.config_relative_path,
+                self.writer,
+                self.ssh_pool,
+            )
+            self.status.record_refresh(
+                item, get_config_diff(self.config_relative_path, item)
+            )
+        elif item in streaming_templates:
+            if refresh_streaming_items(
+                self.service,
+                self.history,
+                self.config_relative_path,
+                [item],
+                self.writer,
+                self.status,
+            ):
+                report_running_change(
+                    self.cucmpub,
+                    self.config_relative_path,
+                    item,
+                    self.email_recipient,
+                    self.status,
+                )
+        else:
+            # Only the periodic checks of change driven templates trust the
+            # fingerprint, listChange reports the in-place changes it can't see.
+            response, fingerprint = fetch_template(
+                self.service,
+                self.history,
+                self.config_relative_path,
+                item,
+                full=reason != "interval" or not get_refresh_policy(item).change_driven,
+                status=self.status,
+            )
+            if response is None:
+                return
+            update_runningconfig(
+                self.cucmpub,
+                self.config_relative_path,
+                item,
+                response,
+                self.email_recipient,
+                self.writer,
+                self.status,
+            )
+            if fingerprint is not None:
+                record_manifest(
+                    self.config_relative_path, {}, fingerprints={item: fingerprint}
+                )
+
+    def cycle(self) -> bool:
+        """Polls listChange when due and refreshes the due items, False on a fatal error"""
+        PROFILER.cycle_started(self.name)
+        try:
+            with PROFILER.span(f"cycle:{self.name}" if self.name else "cycle"):
+                return self.run_cycle()
+        finally:
+            PROFILER.cycle_finished(self.name)
+
+    def run_cycle(self) -> bool:
+        # Snapshots refreshed during this cycle are published as one generation at its end.
+        self.writer = SnapshotWriter()
+        cycle_start = time.monotonic()
+        if cycle_start >= self.next_poll:
+            start_change_id = {
+                "queueId": self.queue_id,
+                "_value_1": self.next_start_change_id,
+            }
+            object_list = [{"object": [*self.templates, *streaming_change_types()]}]
+            # Execute the listChange request
+            try:
+                with PROFILER.span("listChange"):
+                    resp = self.service.listChange(start_change_id, object_list)
+
+            except Exception as err:
+                self.log(f"Zeep error: polling listChange: {err}")
+                return False
+            self.status.incr("listchange_polls")
+
+            if resp.changes:
+                self.status.incr("changes_received", len(resp.changes.change))
+                events = list_change_events(resp.changes.change, self.queue_id)
+                for sink in self.sinks:
+                    sink.write(events)
+                # Refresh the changed items and the items joining their tables.
+                self.scheduler.mark_changed(
+                    affected_config_items({event.type for event in events})
+                )
+
+            # Update the next highest change Id
+            self.next_start_change_id = resp.queueInfo.nextStartChangeId
+            self.next_poll = cycle_start + self.poll_interval
+
+        self.scheduler.collect_due(time.monotonic())
+        try:
+            refreshed = self.scheduler.run(self.refresh, self.cycle_budget)
+        except Exception as e:
+            self.status.incr("refresh_errors")
+            self.log("Unable to update the running config" + str(e))
+            return False
+        finally:
+            # The items refreshed before a failure are published too, the scheduler
+            # already counts them as up to date.
+            with PROFILER.span("publish"):
+                self.writer.flush()
+        if set(refreshed) & dial_plan_edges.keys():
+            update_dial_plan_index(self.config_relative_path, refreshed)
+        self.status.set("last_cycle_seconds", round(time.monotonic() - cycle_start, 3))
+        return True
+
+    def next_wakeup(self) -> float:
+        # Items left over by the cycle budget are picked up without waiting.
+        if self.scheduler.pending:
+            return 0.0
+        return min(self.next_poll, self.scheduler.next_due())
+
+    def close(self) -> None:
+        for sink in self.sinks:
+            sink.close()
+        self.ssh_pool.close()
+
+
+def listen_for_profiling(config_relative_path, monitors=(None,)) -> None:
+    """Lets PROFILE_SIGNAL start and stop a profile of the monitoring loop.
+
+    monitors names the clusters whose cycles a capture counts.
+    """
+    PROFILER.output_dir = os.path.join(config_relative_path, PROFILE_DIR)
+    PROFILER.monitors = set(monitors)
+    # Signal handlers can only be set from the main thread, ex: not when embedded.
+    if threading.current_thread() is threading.main_thread():
+        signal.signal(PROFILE_SIGNAL, PROFILER.handle_signal)
+
+
 def list_change(
     cucmpub,
     config_relative_path,
@@ -427,115 +3281,264 @@ def list_change(
     history,
     templates,
     email_recipient,
+    workers=None,
+    status_port=STATUS_PORT,
+    print_changes=True,
+    poll_interval=LISTCHANGE_POLL_INTERVAL,
+    cycle_budget=REFRESH_CYCLE_BUDGET,
 ) -> int:
-    try:
-        auto_check(cucmpub, config_relative_path, service, history, email_recipient)
-        resp = service.listChange()
-    except Fault as err:
-        if does_last_response_report_credential_error(history):
-            raise ServerCredentialError(err)
-        else:
-            print(f"\nZeep error: polling listChange: {err}")
-            sys.exit(1)
-    print("Initial listChange response:")
-    print()
-    print(resp)
-
-    queue_id = resp.queueInfo.queueId
-    next_start_change_id = resp.queueInfo.nextStartChangeId
+    start_status_server(status_port)
+    listen_for_profiling(config_relative_path)
+    monitor = ClusterMonitor(
+        None,
+        cucmpub,
+        config_relative_path,
+        cucm_cli_username,
+        cucm_cli_password,
+        service,
+        history,
+        templates,
+        email_recipient,
+        workers,
+        print_changes,
+        poll_interval,
+        cycle_budget,
+    )
+    if not monitor.start():
+        sys.exit(1)
 
     print()
     print("Starting loop to monitor changes...")
     print("(Press Ctrl+C to exit)")
     print()
-    print(f"Action doGet? Type{16 * ' '} UUID{32 * ' '} Field{10 * ' '} Value")
-    print(f"{6 * '-'} {6 * '-'} {20 * '-'} {36 * '-'} {15 * '-'} {15 * '-'}")
 
-    actions = {"a": "Add", "u": "Update", "r": "Remove"}
+    while monitor.cycle():
+        time.sleep(max(0.0, monitor.next_wakeup() - time.monotonic()))
 
-    while True:
-        start_change_id = {"queueId": queue_id, "_value_1": next_start_change_id}
-        object_list = [{"object": list(templates.keys())}]
-        change_types = set()
-        # Execute the listChange request
-        try:
-            resp = service.listChange(start_change_id, object_list)
-
-        except Exception as err:
-            print(f"\nZeep error: polling listChange: {err}")
-            break
-
-        if resp.changes:
-            # Loop through each change in the changes list
-            for change in resp.changes.change:
-                change_types.add(change.type)
-                # If there are any items in the changedTags list...
-                if change.changedTags:
-                    # Loop through each changedTag
-                    for x in range(len(change.changedTags.changedTag)):
-                        # If this is the first changedTag, print a full line of data...
-                        if x == 0:
-                            print(
-                                actions[change.action].ljust(6, " "),
-                                change.doGet.ljust(6, " "),
-                                change.type.ljust(20, " "),
-                                change.uuid,
-                                change.changedTags.changedTag[x].name.ljust(15, " "),
-                                change.changedTags.changedTag[x]._value_1,
-                            )
-
-                        # otherwise print just the field/value part of the line
-                        else:
-                            print(
-                                71 * " ",
-                                change.changedTags.changedTag[x].name.ljust(15, " "),
-                                change.changedTags.changedTag[x]._value_1,
-                            )
-
-                # otherwise just print the minimum details
-                else:
-                    print(
-                        actions[change.action].ljust(6, " "),
-                        change.doGet.ljust(6, " "),
-                        change.type.ljust(20, " "),
-                        change.uuid,
-                    )
-            try:
-                for change in change_types:
-                    response = execute_sql_query(service, history, templates[change])
-                    update_runningconfig(
-                        cucmpub, config_relative_path, change, response, email_recipient
+    monitor.close()
+    # We should not exit from the loop above unless there is an error.
+    return 1
+
+
+def start_monitor(monitor) -> bool:
+    """Starts one cluster of track_clusters, its errors only fail that cluster"""
+    try:
+        started = monitor.start()
+    except Exception as err:
+        if isinstance(err, ServerCredentialError):
+            err = f"credential error: {err}"
+        monitor.log(f"Unable to start monitoring the cluster, {err}")
+        monitor.status.fail(str(err))
+        return False
+    if not started:
+        monitor.status.fail("listChange failed")
+    return started
+
+
+def track_clusters(monitors, status_port=STATUS_PORT, max_parallel=None) -> int:
+    """Runs the list_changes loop of several clusters from one process.
+
+    At most max_parallel cycles run at once and a cluster never has two cycles in
+    flight. When more clusters are due than there are slots, the one waiting the
+    longest goes first so a busy cluster can't starve the others. A cluster whose
+    loop fails is dropped and the others carry on.
+    """
+    start_status_server(
+        status_port, {monitor.name: monitor.status for monitor in monitors}
+    )
+    # Profiles cover every cluster, they are written under the first one.
+    listen_for_profiling(
+        monitors[0].config_relative_path, [monitor.name for monitor in monitors]
+    )
+    max_parallel = max_parallel or min(len(monitors), 8)
+    with ThreadPoolExecutor(max_workers=max_parallel) as pool:
+        started = list(pool.map(start_monitor, monitors))
+        active = [monitor for monitor, ok in zip(monitors, started) if ok]
+        for monitor in set(monitors) - set(active):
+            PROFILER.forget(monitor.name)
+            monitor.close()
+        if not active:
+            return 1
+
+        print()
+        print(f"Starting loop to monitor changes on {len(active)} clusters...")
+        print("(Press Ctrl+C to exit)")
+        print()
+
+        running = {}
+        # When each idle cluster became due, the oldest is served first.
+        due_since = {}
+        while active:
+            now = time.monotonic()
+            for monitor in active:
+                if monitor not in running.values() and monitor.next_wakeup() <= now:
+                    due_since.setdefault(monitor.name, now)
+            ready = sorted(
+                (monitor for monitor in active if monitor.name in due_since),
+                key=lambda monitor: due_since[monitor.name],
+            )
+            for monitor in ready[: max_parallel - len(running)]:
+                del due_since[monitor.name]
+                running[pool.submit(monitor.cycle)] = monitor
+            wake_up = min(
+                (
+                    monitor.next_wakeup()
+                    for monitor in active
+                    if monitor not in running.values() and monitor.name not in due_since
+                ),
+                default=None,
+            )
+            timeout = None if wake_up is None else max(0.0, wake_up - time.monotonic())
+            if not running:
+                time.sleep(timeout or 0.0)
+                continue
+            done, _ = wait(running, timeout=timeout, return_when=FIRST_COMPLETED)
+            for future in done:
+                monitor = running.pop(future)
+                if future.exception() is not None or not future.result():
+                    monitor.log("Stopped monitoring the cluster after an error")
+                    monitor.status.fail(str(future.exception() or "refresh error"))
+                    PROFILER.forget(monitor.name)
+                    monitor.close()
+                    active.remove(monitor)
+
+    # We should not exit from the loop above unless every cluster failed.
+    return 1
+
+
+def list_change_events(changes, queue_id) -> list:
+    logged_at = datetime.now().isoformat(timespec="seconds")
+    events = []
+    for change in changes:
+        common = dict(
+            logged_at=logged_at,
+            queue_id=queue_id,
+            action=change.action,
+            doget=change.doGet,
+            type=change.type,
+            uuid=change.uuid,
+        )
+        if change.changedTags:
+            for x, tag in enumerate(change.changedTags.changedTag):
+                events.append(
+                    ChangeEvent(
+                        **common, field=tag.name, value=tag._value_1, tag_index=x
                     )
-            except Exception as e:
-                print("Unable to update the running config" + str(e))
-                break
+                )
+        else:
+            events.append(ChangeEvent(**common))
+    return events
+
+
+def parse_change_time(value) -> str | None:
+    """Accepts an ISO date/time or a relative age such as 30m, 12h or 7d.
+
+    The change log is in naive local time, so a time with an offset is converted to it.
+    Raises ValueError for anything else.
+    """
+    if value is None:
+        return None
+    match = re.fullmatch(r"(\d+)([mhd])", value)
+    if match:
+        unit = {"m": "minutes", "h": "hours", "d": "days"}[match.group(2)]
+        moment = datetime.now() - timedelta(**{unit: int(match.group(1))})
+    else:
+        try:
+            moment = datetime.fromisoformat(value)
+        except ValueError:
+            raise ValueError(
+                f"{value!r} is neither an ISO date/time nor an age such as 12h or 7d"
+            )
+        if moment.tzinfo is not None:
+            moment = moment.astimezone().replace(tzinfo=None)
+    return moment.isoformat(timespec="seconds")
+
+
+def change_time_argument(value) -> str | None:
+    try:
+        return parse_change_time(value)
+    except ValueError as err:
+        raise argparse.ArgumentTypeError(str(err))
 
-        # Update the next highest change Id
-        next_start_change_id = resp.queueInfo.nextStartChangeId
-        get_presence_server_high_availability_and_save_in_csv(
-            cucmpub, cucm_cli_username, cucm_cli_password, config_relative_path
+
+def query_changes(
+    config_relative_path, *, type, uuid, field, since, until, limit
+) -> int:
+    change_log = ChangeLog(config_relative_path)
+    try:
+        rows = change_log.query(
+            type=type,
+            uuid=uuid,
+            field=field,
+            since=parse_change_time(since),
+            until=parse_change_time(until),
+            limit=limit,
+        )
+    finally:
+        change_log.close()
+    if not rows:
+        print("No changes found")
+        return 0
+    print(
+        tabulate(
+            rows,
+            headers=["Time", "Action", "doGet?", "Type", "UUID", "Field", "Value"],
         )
-        time.sleep(600)
+    )
+    return 0
 
-    # We should not exit from the "while True" loop above unless there is an
-    # error.
-    return 1
 
+@profile_span("dialplan")
+def update_dial_plan_index(config_relative_path, config_items=None) -> None:
+    index = DialPlanIndex(config_relative_path)
+    try:
+        index.update(config_items)
+    finally:
+        index.close()
+
+
+def impact(config_relative_path, name, reach=True, refs=True) -> int:
+    """Prints what a dial plan element reaches and what references it.
+
+    Ex: the partitions, patterns, route lists, route groups and devices a CSS reaches,
+    or the CSSs, device pools and translation patterns depending on a partition.
+    """
+    index = DialPlanIndex(config_relative_path)
+    try:
+        index.update()
+        nodes = index.resolve(name)
+        if not nodes:
+            print(f'" {name} " is not in the dial plan index')
+            return 1
+        sections = []
+        if reach:
+            sections.append(("Reaches", index.closure(nodes)))
+        if refs:
+            sections.append(("Referenced by", index.closure(nodes, reverse=True)))
+    finally:
+        index.close()
+    for title, found in sections:
+        print(f"\n{title} ({len(found)}):\n")
+        print(
+            tabulate(
+                [node.split(":", 1) for node in found],
+                headers=["Type", "Name"],
+            )
+        )
+    return 0
 
-def ucconfig_diff_check(config_relative_path, config_item) -> int:
+
+def ucconfig_diff_check(trackers, config_item) -> int:
     diff_items = []
     config_item.append("Imp_High_Availability_Status")
-    for item in config_item:
-        df1 = pd.read_csv(
-            get_config_relative_path("baseconfig", config_relative_path, item)
-        ).replace(np.nan, "")
-        df2 = pd.read_csv(
-            get_config_relative_path("runningconfig", config_relative_path, item)
-        ).replace(np.nan, "")
-        if df2.equals(df1):
-            logging.info(f"No changes were detected in {item}")
-        else:
-            diff_items.append(item)
+    for tracker in trackers:
+        # Served from the diff cache unless a snapshot changed since the last check.
+        for item, diff in tracker.diff(config_item).items():
+            name = f"{tracker.name}:{item}" if len(trackers) > 1 else item
+            if diff.html:
+                diff_items.append(name)
+            else:
+                logging.info(f"No changes were detected in {name}")
 
     if diff_items:
         print(f"Changes detected for the items {diff_items}")
@@ -544,6 +3547,30 @@ def ucconfig_diff_check(config_relative_path, config_item) -> int:
         return 0
 
 
+def seed_status(config_relative_path, config_items, status=STATUS) -> None:
+    for item in config_items:
+        running = get_config_relative_path("runningconfig", config_relative_path, item)
+        try:
+            refreshed = datetime.fromtimestamp(os.path.getmtime(running))
+            diff = get_config_diff(config_relative_path, item)
+        except FileNotFoundError:
+            continue
+        status.record_refresh(item, diff, refreshed)
+
+
+def start_status_server(port, statuses=None) -> ThreadingHTTPServer:
+    """Starts the local status service in a daemon thread of the monitoring process.
+
+    statuses maps cluster names to their TrackerStatus, by default the single cluster
+    status is served.
+    """
+    server = ThreadingHTTPServer(("127.0.0.1", port), StatusRequestHandler)
+    server.statuses = statuses or {None: STATUS}  # pyright: ignore[reportAttributeAccessIssue]
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    print(f"Status service listening on http://127.0.0.1:{port}/")
+    return server
+
+
 route_pattern_sql = """select n.dnorpattern, rp.name as partition, n.description, n.blockenable, n.patternurgency, eccp.name as externalcallprofile,
                         n.supportoverlapsending, n.outsidedialtone, n.deviceoverride, n.authorizationcoderequired, n.clientcoderequired,
                         ts.name as UseCallingPartysExternalMask, n.callingpartytransformationmask, n.callingpartyprefixdigits,
@@ -760,9 +3787,9 @@ date_time_group_sql = """select d.name, d.datetemplate, t.name as timezone, ns.n
                         nsd.fkdatetimesetting = d.pkid left join ntpserver as ns on nsd.fkntpserver = ns.pkid order by d.name, nsd.selectionorder"""
 
 
-route_lists_sql = """select n.dnorpattern as pattern,d.name as RouteList,n.description, rg.name as route_group,rl.selectionorder from device as d left join devicenumplanmap as dnp on dnp.fkdevice=d.pkid
+route_lists_sql = """select n.dnorpattern as pattern,d.name as RouteList,n.description, rg.name as route_group,rl.selectionorder, rp.name as partition from device as d left join devicenumplanmap as dnp on dnp.fkdevice=d.pkid
                     left join routelist as rl on rl.fkdevice=d.pkid right join numplan as n on dnp.fknumplan=n.pkid left join routegroup as
-                    rg on rl.fkroutegroup=rg.pkid where n.tkpatternusage=5 or tkpatternusage=9"""
+                    rg on rl.fkroutegroup=rg.pkid left join routepartition as rp on n.fkroutepartition=rp.pkid where n.tkpatternusage=5 or tkpatternusage=9"""
 
 
 sip_route_patterns_sql = """select n.dnorpattern, n.description, rp.name as partition, n.blockenable, n.tkstatus_usefullyqualcallingpartynum as UseCallingPartysExternalMask,
@@ -883,6 +3910,376 @@ templates = {
 }
 
 
+axl_nodes_sql = """select pn.name from processnode as pn inner join processnodeservice as pns on pns.fkprocessnode=pn.pkid
+inner join typeservice as ts on pns.tkservice=ts.enum where ts.name='Cisco AXL Web Service' and pns.enable='t' and pn.tknodeusage=1 order by pn.name"""
+
+phone_sql = """select first {first} d.pkid, d.name, d.description, tm.name as model, dp.name as devicepool, css.name as css, l.name as location,
+              cpc.name as commonphoneprofile, sp.name as securityprofile, pt.name as phonebuttontemplate, eu.userid as owner
+              from device as d inner join typemodel as tm on d.tkmodel=tm.enum left join devicepool as dp on d.fkdevicepool=dp.pkid
+              left join callingsearchspace as css on d.fkcallingsearchspace=css.pkid left join location as l on d.fklocation=l.pkid
+              left join commonphoneconfig as cpc on d.fkcommonphoneconfig=cpc.pkid left join securityprofile as sp on d.fksecurityprofile=sp.pkid
+              left join phonetemplate as pt on d.fkphonetemplate=pt.pkid left join enduser as eu on d.fkenduser=eu.pkid
+              where d.tkclass=1 and d.pkid > '{after}' order by d.pkid"""
+
+
+line_sql = """select first {first} n.pkid, n.dnorpattern, rp.name as partition, n.description, n.alertingname, css.name as css, vmp.name as voicemailprofile
+             from numplan as n left join routepartition as rp on n.fkroutepartition=rp.pkid
+             left join callingsearchspace as css on n.fkcallingsearchspace_sharedlineappear=css.pkid
+             left join voicemessagingprofile as vmp on n.fkvoicemessagingprofile=vmp.pkid
+             where n.tkpatternusage=2 and n.pkid > '{after}' order by n.pkid"""
+
+
+phone_line_sql = """select first {first} dnp.pkid, d.name as device, dnp.numplanindex, n.dnorpattern, rp.name as partition, dnp.display, dnp.label,
+                   dnp.e164mask, dnp.maxnumcalls, dnp.busytrigger from devicenumplanmap as dnp inner join device as d on dnp.fkdevice=d.pkid
+                   inner join numplan as n on dnp.fknumplan=n.pkid left join routepartition as rp on n.fkroutepartition=rp.pkid
+                   where d.tkclass=1 and dnp.pkid > '{after}' order by dnp.pkid"""
+
+
+end_user_sql = """select first {first} eu.pkid, eu.userid, eu.firstname, eu.lastname, eu.mailid, eu.telephonenumber, eu.department, eu.islocaluser,
+                 ucsp.name as serviceprofile from enduser as eu left join ucserviceprofile as ucsp on eu.fkucserviceprofile=ucsp.pkid
+                 where eu.pkid > '{after}' order by eu.pkid"""
+
+
+# Device and user scale config items. They are pulled in chunks, written to disk as they
+# arrive and diffed with a streaming merge instead of loading them into pandas.
+streaming_templates = {
+    "Phone": StreamingConfigItem(phone_sql, change_types=("Phone",)),
+    "Line": StreamingConfigItem(line_sql, change_types=("Line",)),
+    "PhoneLine": StreamingConfigItem(phone_line_sql, change_types=("Phone", "Line")),
+    "User": StreamingConfigItem(end_user_sql, change_types=("User",)),
+}
+
+
+# Config items whose listChange type reports changes to a table. A change to one of them
+# can change the rows of every other config item that joins that table.
+table_owners = {
+    "routepartition": ("RoutePartition",),
+    "callingsearchspace": ("Css",),
+    "externalcallcontrolprofile": ("ExternalCallControlProfile",),
+    "devicepool": ("DevicePool",),
+    "callmanagergroup": ("CallManagerGroup",),
+    "datetimesetting": ("DateTimeGroup",),
+    "ntpserver": ("PhoneNtp",),
+    "location": ("Location",),
+    "physicallocation": ("PhysicalLocation",),
+    "mraservicedomain": ("MraServiceDomain",),
+    "mediaresourcelist": ("MediaResourceList",),
+    "geolocation": ("GeoLocation",),
+    "routegroup": ("RouteGroup",),
+    "sipprofile": ("SipProfile",),
+    "securityprofile": ("SipTrunkSecurityProfile", "PhoneSecurityProfile"),
+    "codeclist": ("AudioCodecPreferenceList",),
+    "ucservice": ("UcService",),
+    "ucserviceprofile": ("ServiceProfile",),
+    "ldapfilter": ("LdapFilter",),
+    "commonphoneconfig": ("CommonPhoneConfig",),
+    "phonetemplate": ("PhoneButtonTemplate",),
+    "dirgroup": ("UserGroup",),
+    "enduser": ("User",),
+    "numplan": ("RoutePattern", "SipRoutePattern", "Line"),
+    "device": ("SipTrunk", "RouteList"),
+}
+
+# Dependencies declared by hand where the ones derived from the joins are too broad.
+dependency_overrides = {
+    "PhoneLine": {"Phone", "Line", "RoutePartition"},
+}
+
+
+def sql_tables(sql) -> list:
+    """Tables of the from and join clauses of a template, the primary table first"""
+    return re.findall(r"\b(?:from|join)\s+(\w+)", sql, re.IGNORECASE)
+
+
+def derive_config_dependencies() -> dict:
+    """Maps every config item to the config items whose changes alter its rows.
+
+    Derived from the tables each template joins, except its own primary table, so items
+    sharing a primary table (the numplan based patterns for example) don't depend on
+    each other.
+    """
+    sql_by_item = {
+        **templates,
+        **{item: spec.sql for item, spec in streaming_templates.items()},
+    }
+    dependencies = {}
+    for item, sql in sql_by_item.items():
+        upstream = set()
+        for table in sql_tables(sql)[1:]:
+            upstream.update(table_owners.get(table.lower(), ()))
+        upstream.discard(item)
+        dependencies[item] = dependency_overrides.get(item, upstream)
+    return dependencies
+
+
+config_dependencies = derive_config_dependencies()
+
+
+# Columns holding a whole XML document, stored out of line and diffed per element.
+blob_columns = {
+    "ServiceProfile": ("xml",),
+    "CommonPhoneConfig": ("xml",),
+}
+
+# How each dial plan snapshot row turns into reference edges of the DialPlanIndex.
+# Patterns and the route lists they route to meet on a dn:pattern@partition node, the
+# same digits in another partition are another pattern.
+DIAL_PLAN_KINDS = (
+    "css",
+    "partition",
+    "routepattern",
+    "siproutepattern",
+    "transpattern",
+    "dn",
+    "routelist",
+    "routegroup",
+    "device",
+    "devicepool",
+)
+
+
+def pattern_edges(kind, row) -> list:
+    pattern = f"{kind}:{row['dnorpattern']}@{row['partition']}"
+    edges = [
+        (f"partition:{row['partition']}", pattern),
+        (pattern, f"dn:{row['dnorpattern']}@{row['partition']}"),
+    ]
+    if kind == "transpattern":
+        edges.append((pattern, f"css:{row['css']}"))
+    return edges
+
+
+dial_plan_edges = {
+    "Css": lambda row: [
+        (f"css:{row['CSS_Name']}", f"partition:{row['Route Partition']}")
+    ],
+    "RoutePartition": lambda row: [],
+    "RoutePattern": lambda row: pattern_edges("routepattern", row),
+    "SipRoutePattern": lambda row: pattern_edges("siproutepattern", row),
+    "TransPattern": lambda row: pattern_edges("transpattern", row),
+    "RouteList": lambda row: [
+        (
+            f"dn:{row['Pattern']}@{row.get('Partition') or ''}",
+            f"routelist:{row['RouteList']}",
+        ),
+        (f"routelist:{row['RouteList']}", f"routegroup:{row['RouteGroup']}"),
+    ],
+    "RouteGroup": lambda row: [
+        (f"routegroup:{row['name']}", f"device:{row['device']}")
+    ],
+    "DevicePool": lambda row: (
+        [
+            (f"devicepool:{row['name']}", f"css:{value}")
+            for column, value in row.items()
+            if column and "css" in column
+        ]
+        + [
+            (
+                f"devicepool:{row['name']}",
+                f"routegroup:{row['standard_local_route_group']}",
+            )
+        ]
+    ),
+}
+
+# Refresh policies of the monitoring daemon, config items not listed here use the
+# default RefreshPolicy. Imp_High_Availability_Status is operational state pulled over
+# SSH, so it is polled on a tight interval instead of being change driven. The
+# streaming items have no fingerprint, a periodic check would be a full pull.
+refresh_policies = {
+    "Imp_High_Availability_Status": RefreshPolicy(
+        change_driven=False, interval=60.0, reconcile_interval=None, priority=0
+    ),
+    "RoutePattern": RefreshPolicy(
+        interval=900.0, reconcile_interval=24 * 3600.0, priority=10
+    ),
+    "TransPattern": RefreshPolicy(
+        interval=900.0, reconcile_interval=24 * 3600.0, priority=10
+    ),
+    "Css": RefreshPolicy(priority=10),
+    "RoutePartition": RefreshPolicy(priority=10),
+    "RouteList": RefreshPolicy(priority=20),
+    "RouteGroup": RefreshPolicy(priority=20),
+    "SipTrunk": RefreshPolicy(priority=20),
+    "ServiceParameter": RefreshPolicy(priority=90),
+    "RemoteCluster": RefreshPolicy(priority=90),
+    "Phone": RefreshPolicy(interval=None, reconcile_interval=24 * 3600.0, priority=80),
+    "Line": RefreshPolicy(interval=None, reconcile_interval=24 * 3600.0, priority=80),
+    "PhoneLine": RefreshPolicy(
+        interval=None, reconcile_interval=24 * 3600.0, priority=80
+    ),
+    "User": RefreshPolicy(interval=None, reconcile_interval=24 * 3600.0, priority=80),
+}
+
+DEFAULT_REFRESH_POLICY = RefreshPolicy()
+
+
+def get_refresh_policy(config_item) -> RefreshPolicy:
+    return refresh_policies.get(config_item, DEFAULT_REFRESH_POLICY)
+
+
+class Tracker:
+    """Engine tracking one cluster, importable by other tooling. The CLI wraps it.
+
+    The AXL service and the CLI session are opened on first use and kept, and the WSDL,
+    diff cache and diff processes are shared process-wide, so the methods can be called
+    repeatedly without paying the startup again. Ex:
+
+        tracker = Tracker(get_clusters(config)[0])
+        diffs = tracker.check(["RoutePattern"], notify=False)
+        tracker.commit(tracker.changed_items(), "CHG0012345")
+    """
+
+    def __init__(
+        self,
+        cluster,
+        certroot=None,
+        email_recipient="uc-admin",
+        workers=None,
+        status=None,
+    ):
+        self.cluster = cluster
+        self.name = cluster.get("name")
+        self.cucmpub = cluster["cucmpub"]
+        self.config_relative_path = cluster["config_relative_path"]
+        self.certroot = certroot or os.getenv(
+            "REQUESTS_CA_BUNDLE", default="/etc/pki/tls/cert.pem"
+        )
+        self.email_recipient = email_recipient
+        self.workers = workers
+        self.status = status or TrackerStatus()
+        self.templates = templates
+        self.streaming_templates = streaming_templates
+        self.ssh_pool = SSHSessionPool(
+            self.cucmpub, cluster["cucm_cli_username"], cluster["cucm_cli_password"]
+        )
+        self.service = None
+        self.history = None
+
+    def connect(self) -> tuple:
+        """AXL service and history of the cluster, created once"""
+        if self.service is None:
+            self.service, self.history = create_cluster_service(
+                self.cluster, self.certroot
+            )
+        return self.service, self.history
+
+    def config_items(self) -> list:
+        return sorted([*self.templates, *self.streaming_templates])
+
+    def fetch(self, config_items=None, full=True) -> list:
+        """Pulls the running config of the items, all of them by default.
+
+        Returns the items actually pulled, without full the templates whose fingerprint
+        is unchanged are skipped.
+        """
+        service, history = self.connect()
+        return refresh_running_configs(
+            service,
+            history,
+            self.config_relative_path,
+            config_items or [*self.templates, *self.streaming_templates],
+            full,
+            self.status,
+            self.ssh_pool,
+        )
+
+    def diff(self, config_items=None) -> dict:
+        """ConfigDiff of the base and running config of each item, from the cache if possible"""
+        return compare_all_with_base(
+            self.config_relative_path,
+            config_items or self.config_items(),
+            self.workers,
+        )
+
+    def check(self, config_items=None, full=True, notify=True) -> dict:
+        """Fetches and diffs the items, records their status and emails the changes.
+
+        The diffs are returned in the order of config_items, the template order by
+        default.
+        """
+        service, history = self.connect()
+        return check_running_configs(
+            self.cucmpub,
+            self.config_relative_path,
+            service,
+            history,
+            config_items or [*self.templates, *self.streaming_templates],
+            self.email_recipient,
+            self.workers,
+            self.status,
+            full,
+            notify,
+            self.ssh_pool,
+        )
+
+    def drift(self, config_items=None) -> list:
+        """Items whose base and running configs differ, from the snapshots on disk"""
+        return [item for item, diff in self.diff(config_items).items() if diff.html]
+
+    def changed_items(self) -> list:
+        return changed_items_from_manifest(self.config_relative_path)
+
+    def commit(self, config_items, commit, username=None) -> int:
+        """Commits the running config of the items as the new base config generation"""
+        return update_baseconfig(
+            self.cucmpub,
+            self.config_relative_path,
+            config_items,
+            username or getpass.getuser(),
+            commit,
+            self.email_recipient,
+            self.status,
+        )
+
+    def references(self, name, reverse=False) -> list:
+        """Dial plan elements reached from name, or referencing it when reverse is set"""
+        index = DialPlanIndex(self.config_relative_path)
+        try:
+            index.update()
+            nodes = index.resolve(name)
+            return index.closure(nodes, reverse) if nodes else []
+        finally:
+            index.close()
+
+    def changes(self, **filters) -> list:
+        """listChange events of the change log, filtered like ChangeLog.query"""
+        change_log = ChangeLog(self.config_relative_path)
+        try:
+            return change_log.query(**filters)
+        finally:
+            change_log.close()
+
+    def monitor(
+        self,
+        print_changes=True,
+        poll_interval=LISTCHANGE_POLL_INTERVAL,
+        cycle_budget=REFRESH_CYCLE_BUDGET,
+    ) -> ClusterMonitor:
+        """ClusterMonitor running the list_changes loop of the cluster"""
+        service, history = self.connect()
+        return ClusterMonitor(
+            self.name,
+            self.cucmpub,
+            self.config_relative_path,
+            self.cluster["cucm_cli_username"],
+            self.cluster["cucm_cli_password"],
+            service,
+            history,
+            self.templates,
+            self.email_recipient,
+            self.workers,
+            print_changes,
+            poll_interval,
+            cycle_budget,
+            self.status,
+            self.ssh_pool,
+        )
+
+    def close(self) -> None:
+        self.ssh_pool.close()
+
+
 CONFIG_FILE = Path.home() / ".cucmconfigtracker.json"
 
 
@@ -931,6 +4328,25 @@ def load_or_prompt_config() -> dict:
     return config
 
 
+def get_clusters(config, name=None) -> list:
+    """Clusters of the saved config, optionally only the one called name.
+
+    A config with a "clusters" list tracks each entry, named by its "name" key, with
+    the same keys as a single cluster config. Otherwise the config is the one cluster.
+    """
+    clusters = config.get("clusters") or [{"name": config["cucmpub"], **config}]
+    if name is None:
+        return clusters
+    selected = [cluster for cluster in clusters if cluster["name"] == name]
+    if not selected:
+        print(
+            'Cluster " {} " is not in the config. Configured clusters are:\n\n{}'.format(
+                name, "\n".join(cluster["name"] for cluster in clusters)
+            )
+        )
+    return selected
+
+
 def main() -> int:
     # Add this at the very beginning, before load_or_prompt_config()
     if "--reconfigure" in sys.argv:
@@ -939,15 +4355,6 @@ def main() -> int:
             CONFIG_FILE.unlink()
 
     certroot = os.getenv("REQUESTS_CA_BUNDLE", default="/etc/pki/tls/cert.pem")
-    # Load or prompt for config
-    config = load_or_prompt_config()
-    cucmpub = config["cucmpub"]
-    cucm_axl_username = config["cucm_axl_username"]
-    cucm_axl_password = config["cucm_axl_password"]
-    cucm_cli_username = config["cucm_cli_username"]
-    cucm_cli_password = config["cucm_cli_password"]
-    cucm_axl_api_wsdl_path = config["cucm_axl_api_wsdl_path"]
-    config_relative_path = config["config_relative_path"]
     config_parent_parser = argparse.ArgumentParser(add_help=False)
     config_parent_parser.add_argument(
         "config_item",
@@ -960,13 +4367,41 @@ def main() -> int:
         default="uc-admin",
         help="Enter the email address to send the change summary details to",
     )
-    commit_parent_parser = argparse.ArgumentParser(add_help=False)
-    commit_parent_parser.add_argument(
-        "commit",
-        help="Specify the reason or the jira for the change",
+    workers_parent_parser = argparse.ArgumentParser(add_help=False)
+    workers_parent_parser.add_argument(
+        "--workers",
+        type=int,
+        default=None,
+        help="Number of processes used to diff the config items, defaults to the number of cores",
+    )
+    status_port_parent_parser = argparse.ArgumentParser(add_help=False)
+    status_port_parent_parser.add_argument(
+        "--status-port",
+        type=int,
+        default=STATUS_PORT,
+        help="Local port of the status service run by list_changes",
     )
-
     parser = argparse.ArgumentParser(description="Choose a command to run.")
+    parser.add_argument(
+        "--record",
+        metavar="ARCHIVE",
+        help="Record the AXL and CLI traffic of the run into a gzip compressed archive",
+    )
+    parser.add_argument(
+        "--replay",
+        metavar="ARCHIVE",
+        help="Serve the AXL and CLI traffic from an archive made with --record instead of the cluster",
+    )
+    parser.add_argument(
+        "--replay-speed",
+        choices=["original", "fast"],
+        default="original",
+        help="Replay with the recorded response times or as fast as possible",
+    )
+    parser.add_argument(
+        "--cluster",
+        help="Name of the cluster to work on when the config lists several clusters",
+    )
     subparser = parser.add_subparsers(dest="command")
     subparser.add_parser("list_all_configs", help="List all the available config items")
     subparser.add_parser(
@@ -977,34 +4412,191 @@ def main() -> int:
         ],
         help="Compares running config and base config of entered config item and notifies about changes, if any.",
     )
-    subparser.add_parser(
+    update_base_parser = subparser.add_parser(
         "update_base",
-        parents=[
-            config_parent_parser,
-            email_recipient_parent_parser,
-            commit_parent_parser,
-        ],
-        help="Update the base config with the most recent running config of the entered config item.",
+        parents=[email_recipient_parent_parser],
+        help="Update the base config with the most recent running config of the entered config items.",
     )
-    subparser.add_parser(
+    update_base_parser.add_argument(
+        "config_items",
+        nargs="*",
+        help="Config items to commit, shell style patterns such as 'Route*' are accepted",
+    )
+    update_base_parser.add_argument(
+        "commit",
+        help="Specify the reason or the jira for the change",
+    )
+    update_base_parser.add_argument(
+        "--all-changed",
+        action="store_true",
+        help="Commit every config item reported as changed by the last check",
+    )
+    check_all_parser = subparser.add_parser(
         "check_all",
-        parents=[email_recipient_parent_parser],
+        parents=[email_recipient_parent_parser, workers_parent_parser],
         help="Verifies all configs from the config items and notifies if there are any changes",
     )
-    subparser.add_parser(
+    check_all_parser.add_argument(
+        "--fast",
+        action="store_true",
+        help="Skip the templates whose fingerprint is unchanged since the last pull, rows modified in place may be missed",
+    )
+    list_changes_parser = subparser.add_parser(
         "list_changes",
         help="List all the changes made in the database",
-        parents=[email_recipient_parent_parser],
+        parents=[
+            email_recipient_parent_parser,
+            workers_parent_parser,
+            status_port_parent_parser,
+        ],
+    )
+    list_changes_parser.add_argument(
+        "--poll-interval",
+        type=float,
+        default=LISTCHANGE_POLL_INTERVAL,
+        help="Seconds between listChange polls",
+    )
+    list_changes_parser.add_argument(
+        "--cycle-budget",
+        type=float,
+        default=REFRESH_CYCLE_BUDGET,
+        help="Seconds a refresh cycle may spend before lower priority items wait for the next one",
+    )
+    list_changes_parser.add_argument(
+        "--no-print-changes",
+        dest="print_changes",
+        action="store_false",
+        help="Only record the listChange events in the change log, don't print them",
+    )
+    query_changes_parser = subparser.add_parser(
+        "query_changes",
+        help="Query the change log recorded by list_changes",
+    )
+    query_changes_parser.add_argument(
+        "--type", help="Config item type, ex: RoutePattern"
+    )
+    query_changes_parser.add_argument("--uuid", help="UUID of the changed object")
+    query_changes_parser.add_argument("--field", help="Name of the changed field")
+    query_changes_parser.add_argument(
+        "--since",
+        type=change_time_argument,
+        help="ISO date/time or age such as 12h or 7d",
+    )
+    query_changes_parser.add_argument(
+        "--until",
+        type=change_time_argument,
+        help="ISO date/time or age such as 12h or 7d",
+    )
+    query_changes_parser.add_argument(
+        "--limit", type=int, default=100, help="Maximum number of events to show"
+    )
+    impact_parser = subparser.add_parser(
+        "impact",
+        help="Show what a CSS, partition, pattern, route list, route group, device or device pool reaches and what references it",
+    )
+    impact_parser.add_argument(
+        "name",
+        help="Dial plan element, optionally with its type, ex: partition:PT_Internal or routepattern:9.@@PT_PSTN",
+    )
+    impact_direction = impact_parser.add_mutually_exclusive_group()
+    impact_direction.add_argument(
+        "--reach",
+        action="store_true",
+        help="Only show what the element reaches",
+    )
+    impact_direction.add_argument(
+        "--refs",
+        action="store_true",
+        help="Only show what references the element",
     )
     subparser.add_parser(
         "uconfigs_check",
         help="Command to run the monitoring check for all items, returns 0 if base and running configs are same, 1 if not",
     )
 
+    status_parser = subparser.add_parser(
+        "status",
+        parents=[status_port_parent_parser],
+        help="Queries the running list_changes daemon, returns 0 if base and running configs are same, 1 if not",
+    )
+    status_parser.add_argument(
+        "--all",
+        action="store_true",
+        help="Print the per item refresh times, last diff summary and metrics",
+    )
+
+    profile_parser = subparser.add_parser(
+        "profile",
+        parents=[status_port_parent_parser],
+        help="Profiles the next cycles of the running list_changes daemon into a flame graph file",
+    )
+    profile_parser.add_argument(
+        "--cycles",
+        type=int,
+        default=PROFILE_CYCLES,
+        help="Number of cycles to profile",
+    )
+    profile_parser.add_argument(
+        "--stop",
+        action="store_true",
+        help="Stop the running profile at the end of the current cycle",
+    )
+
     args = parser.parse_args()
 
-    valid_configitem = list(templates.keys())
-    valid_configitem.sort()
+    # The status clients only talk to the daemon, they don't need the saved config.
+    if args.command == "status":
+        return status_check(args.status_port, args.all)
+    if args.command == "profile":
+        return profile_control(args.status_port, args.cycles, args.stop)
+
+    global TRAFFIC
+    if args.record:
+        TRAFFIC = TrafficArchive(args.record, "record")
+    elif args.replay:
+        TRAFFIC = TrafficArchive(args.replay, "replay", args.replay_speed)
+    if TRAFFIC is not None:
+        atexit.register(TRAFFIC.close)
+
+    # Load or prompt for config
+    clusters = get_clusters(load_or_prompt_config(), args.cluster)
+    if not clusters:
+        return 1
+    # A single cluster reports to the module status served by list_changes.
+    trackers = [
+        Tracker(
+            cluster,
+            certroot,
+            email_recipient=getattr(args, "email_recipient", "uc-admin"),
+            workers=getattr(args, "workers", None),
+            status=STATUS if len(clusters) == 1 else None,
+        )
+        for cluster in clusters
+    ]
+    valid_configitem = trackers[0].config_items()
+    # Checks and monitoring cover every cluster, the other commands work on one.
+    if args.command == "check_all":
+        diffs = {}
+        for tracker in trackers:
+            for item, diff in tracker.check(full=not args.fast).items():
+                diffs[f"{tracker.name}:{item}" if tracker.name else item] = diff
+        print_diffs(diffs)
+        return 0
+    elif args.command == "list_changes" and len(trackers) > 1:
+        monitors = [
+            tracker.monitor(args.print_changes, args.poll_interval, args.cycle_budget)
+            for tracker in trackers
+        ]
+        return track_clusters(monitors, args.status_port)
+    elif args.command == "uconfigs_check":
+        return ucconfig_diff_check(trackers, valid_configitem)
+    elif len(trackers) > 1:
+        print("The config lists several clusters, select one with --cluster")
+        return 1
+
+    tracker = trackers[0]
+    config_relative_path = tracker.config_relative_path
+
     if args.command:
         if args.command == "list_all_configs":
             print("Valid config items are:\n\n{}".format("\n".join(valid_configitem)))
@@ -1018,81 +4610,67 @@ def main() -> int:
                 )
                 return 1
             else:
-                service, history = create_service(
-                    cucmpub=cucmpub,
-                    username=cucm_axl_username,
-                    password=cucm_axl_password,
-                    certroot=certroot,
-                    wsdl_path=cucm_axl_api_wsdl_path,
-                )
-                sql = templates[configitem]
-                resp = execute_sql_query(service, history, sql)
                 try:
-                    update_runningconfig(
-                        cucmpub,
-                        config_relative_path,
-                        configitem,
-                        resp,
-                        email_recipient=args.email_recipient,
-                    )
+                    diffs = tracker.check([configitem], full=True)
                 except Exception as e:
                     print(e)
                     return 1
+                print(diffs[configitem].text, end="")
         elif args.command == "update_base":
-            configitem = args.config_item
-            if configitem not in valid_configitem:
-                print(
-                    'Config item " {} " is not a valid config. Valid config items are:\n\n{}'.format(
-                        configitem, "\n".join(valid_configitem)
+            valid_configitem.append("Imp_High_Availability_Status")
+            if args.all_changed:
+                configitems = tracker.changed_items()
+            else:
+                configitems = []
+            for pattern in args.config_items:
+                matches = fnmatch.filter(valid_configitem, pattern)
+                if not matches:
+                    print(
+                        'Config item " {} " is not a valid config. Valid config items are:\n\n{}'.format(
+                            pattern, "\n".join(valid_configitem)
+                        )
                     )
-                )
+                    return 1
+                configitems.extend(item for item in matches if item not in configitems)
+            if not configitems:
+                print("Enter the config items to commit or --all-changed")
                 return 1
-            else:
-                update_baseconfig(
-                    cucmpub,
-                    config_relative_path,
-                    configitem,
-                    getpass.getuser(),
-                    args.commit,
-                    email_recipient=args.email_recipient,
-                )
-        elif args.command == "check_all":
-            service, history = create_service(
-                cucmpub=cucmpub,
-                username=cucm_axl_username,
-                password=cucm_axl_password,
-                certroot=certroot,
-                wsdl_path=cucm_axl_api_wsdl_path,
-            )
-            auto_check(
-                cucmpub,
-                config_relative_path,
-                service,
-                history,
-                email_recipient=args.email_recipient,
-            )
+            return tracker.commit(configitems, args.commit)
         elif args.command == "list_changes":
-            service, history = create_service(
-                cucmpub=cucmpub,
-                username=cucm_axl_username,
-                password=cucm_axl_password,
-                certroot=certroot,
-                wsdl_path=cucm_axl_api_wsdl_path,
-            )
+            service, history = tracker.connect()
             exit_code = list_change(
-                cucmpub,
+                tracker.cucmpub,
                 config_relative_path,
-                cucm_cli_username,
-                cucm_cli_password,
+                tracker.cluster["cucm_cli_username"],
+                tracker.cluster["cucm_cli_password"],
                 service,
                 history,
                 templates,
                 email_recipient=args.email_recipient,
+                workers=args.workers,
+                status_port=args.status_port,
+                print_changes=args.print_changes,
+                poll_interval=args.poll_interval,
+                cycle_budget=args.cycle_budget,
             )
             return exit_code
-        elif args.command == "uconfigs_check":
-            exit_code = ucconfig_diff_check(config_relative_path, valid_configitem)
-            return exit_code
+        elif args.command == "impact":
+            return impact(
+                config_relative_path,
+                args.name,
+                reach=not args.refs,
+                refs=not args.reach,
+            )
+        elif args.command == "query_changes":
+            return query_changes(
+                config_relative_path,
+                type=args.type,
+                uuid=args.uuid,
+                field=args.field,
+                since=args.since,
+                until=args.until,
+                limit=args.limit,
+            )
         else:
             parser.print_help()
             return 1
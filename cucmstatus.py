@@ -0,0 +1,93 @@
+"""
+Client of the status service run by "cucmconfigtracker.py list_changes".
+
+Monitoring systems that poll the drift status every minute can run this script instead
+of "cucmconfigtracker.py status". It only uses the standard library, so it answers
+without loading pandas, zeep and the other dependencies of the tracker.
+
+To run it, use the command "python3 cucmstatus.py [--all] [--status-port PORT]"
+
+"""
+
+# /// script
+# requires-python = ">=3.12"
+# dependencies = []
+# ///
+
+import argparse
+import json
+import sys
+import urllib.request
+
+# Port of the local status service started by list_changes and queried by "status".
+STATUS_PORT = 8471
+
+
+def status_check(port, show_all) -> int:
+    """Thin client of the status service with the exit codes of uconfigs_check.
+
+    Returns 0 if base and running configs are the same, 1 if not and 2 if the
+    list_changes daemon can't be reached.
+    """
+    path = "/status" if show_all else "/drift"
+    try:
+        with urllib.request.urlopen(f"http://127.0.0.1:{port}{path}", timeout=5) as r:
+            body = json.load(r)
+    except OSError as err:
+        print(f"Unable to reach the status service on port {port}: {err}")
+        return 2
+    if show_all:
+        print(json.dumps(body, indent=2))
+        clusters = body.get("clusters") or {None: body}
+        drift = [
+            f"{name}:{item}" if name else item
+            for name, cluster in clusters.items()
+            for item, state in cluster["items"].items()
+            if state["drift"]
+        ]
+    else:
+        drift = body["drift"]
+    if drift:
+        print(f"Changes detected for the items {drift}")
+        return 1
+    return 0
+
+
+def profile_control(port, cycles, stop) -> int:
+    """Starts or stops a profile of the running list_changes daemon and prints its state"""
+    if not stop and cycles < 1:
+        print("The number of cycles to profile must be at least 1")
+        return 2
+    path = "/profile/stop" if stop else f"/profile?cycles={cycles}"
+    request = urllib.request.Request(f"http://127.0.0.1:{port}{path}", method="POST")
+    try:
+        with urllib.request.urlopen(request, timeout=5) as r:
+            body = json.load(r)
+    except OSError as err:
+        print(f"Unable to reach the status service on port {port}: {err}")
+        return 2
+    print(json.dumps(body, indent=2))
+    return 0
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(
+        description="Queries the running list_changes daemon, returns 0 if base and running configs are same, 1 if not"
+    )
+    parser.add_argument(
+        "--status-port",
+        type=int,
+        default=STATUS_PORT,
+        help="Local port of the status service run by list_changes",
+    )
+    parser.add_argument(
+        "--all",
+        action="store_true",
+        help="Print the per item refresh times, last diff summary and metrics",
+    )
+    args = parser.parse_args()
+    return status_check(args.status_port, args.all)
+
+
+if __name__ == "__main__":
+    sys.exit(main())